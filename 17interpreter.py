@@ -1,11 +1,18 @@
 #!/usr/bin/env python3
 
 import abc
+import argparse
+import functools
+import itertools
+import random
 import re
 import sys
 import tkinter as tk
+from tkinter import ttk
 from PIL import ImageTk, Image
+import numpy as np
 import time
+import tracemalloc
 
 print('\nDesign pattens')
 
@@ -27,85 +34,840 @@ class BaseExpression(metaclass=abc.ABCMeta):
     def interpret(self, ctx):
         pass
 
-# EXPRESSION = '{COMMAND}|{SEQUENCE}|{REPETITION}'
+# PROGRAM    = [(STATEMENT | DEFINITION) {';' (STATEMENT | DEFINITION)}]
+# SEQUENCE   = [STATEMENT {';' STATEMENT}]
+# STATEMENT  = COMMAND | REPETITION | CALL
+# REPETITION = 'loop' INT SEQUENCE ['end']
+#              (without 'end' repeats the rest of the enclosing sequence)
+# DEFINITION = 'def' NAME SEQUENCE 'end'
+# CALL       = NAME
+# COMMAND    = 'right' | 'left' | 'up' | 'down' | 'paint'
 INT = r'[0-9]+'
-COMMANDS = 'right|left|up|down|paint'
-COMMAND = f'^({COMMANDS})$'
-SEQUENCE = f'\s*[({COMMANDS});\s*]+'
-REPETITION = f'^loop\s+(?P<int>{INT})\s+{SEQUENCE}'
-# EXPRESSION = EXPRESSION.format(
-#     COMMAND=COMMAND, SEQUENCE=SEQUENCE, REPETITION=REPETITION
-# )
+TOKEN = f'{INT}|[a-z]+|;|\\S'
+
+# opcodes of the flat program: (MOVE, dx, dy) (PAINT, 0, 0)
+# (STAMP, paint offsets from the robot as an (n, 2) array, 0)
+# (LOOP_START, count, pc after LOOP_END) (LOOP_END, pc of loop body, 0)
+MOVE, PAINT, STAMP, LOOP_START, LOOP_END = range(5)
 
 class RightCommand(BaseExpression):
+    opcode = (MOVE, 8, 0)
+
     def interpret(self, ctx):
-        app = ctx['app']
-        app.canvas.move(app.robot, 8, 0)
+        ctx['backend'].move(8, 0)
+
+    def __repr__(self):
+        return 'right'
 
 class LeftCommand(BaseExpression):
+    opcode = (MOVE, -8, 0)
+
     def interpret(self, ctx):
-        app = ctx['app']
-        app.canvas.move(app.robot, -8, 0)
+        ctx['backend'].move(-8, 0)
+
+    def __repr__(self):
+        return 'left'
 
 class UpCommand(BaseExpression):
+    opcode = (MOVE, 0, -8)
+
     def interpret(self, ctx):
-        app = ctx['app']
-        app.canvas.move(app.robot, 0, -8)
+        ctx['backend'].move(0, -8)
+
+    def __repr__(self):
+        return 'up'
 
 class DownCommand(BaseExpression):
+    opcode = (MOVE, 0, 8)
+
     def interpret(self, ctx):
-        app = ctx['app']
-        app.canvas.move(app.robot, 0, 8)
+        ctx['backend'].move(0, 8)
+
+    def __repr__(self):
+        return 'down'
 
 class PaintCommand(BaseExpression):
+    opcode = (PAINT, 0, 0)
+
     def interpret(self, ctx):
-        app = ctx['app']
-        coords = app.canvas.coords(app.robot)
-        app.paint(*coords)
+        ctx['backend'].paint()
 
+    def __repr__(self):
+        return 'paint'
 
-class Expression(BaseExpression):
-    commands = {
-        'right': RightCommand,
-        'left': LeftCommand,
-        'up': UpCommand,
-        'down': DownCommand,
-        'paint': PaintCommand,
-    }
 
-    def is_repetion(self, code: str):
-        return re.match(REPETITION, code)
+class Sequence(BaseExpression):
+    def __init__(self, expressions=None):
+        self.expressions = expressions if expressions is not None else []
+
+    def interpret(self, ctx):
+        for expr in self.expressions:
+            expr.interpret(ctx)
 
-    def is_sequence(self, code: str):
-        return re.match(SEQUENCE, code)
+    def __repr__(self):
+        return source(self)
 
-    def is_command(self, code: str):
-        return re.match(COMMAND, code)
+class Repetition(BaseExpression):
+    def __init__(self, count: int, body: Sequence):
+        self.count = count
+        self.body = body
 
     def interpret(self, ctx):
-        if self.is_command(ctx['code']):
-            self.commands[ctx['code']]().interpret(ctx)
-        elif self.is_repetion(ctx['code']):
-            Repetition().interpret(ctx)
-        elif self.is_sequence(ctx['code']):
-            Sequence().interpret(ctx)
+        for i in range(self.count):
+            self.body.interpret(ctx)
+
+    def __repr__(self):
+        return source(self)
+
+class Procedure(BaseExpression):
+    def __init__(self, name: str, body: Sequence):
+        self.name = name
+        self.body = body
+        # folded opcodes of the body, compiled by the first call
+        self.block = None
 
-class Sequence(BaseExpression):
     def interpret(self, ctx):
-        all_expr = ctx['code'].split(';')
-        for expr in all_expr:
-            ctx = {**ctx}
-            ctx['code'] = expr.strip()
-            Expression().interpret(ctx)
+        # a definition does nothing until it is called
+        pass
+
+    def __repr__(self):
+        return source(self)
+
+class Call(BaseExpression):
+    def __init__(self, name: str):
+        self.name = name
+
+    def interpret(self, ctx):
+        ctx['procedures'][self.name].body.interpret(ctx)
+
+    def __repr__(self):
+        return self.name
+
+class Program(Sequence):
+    def __init__(self, expressions=None, procedures=None):
+        super().__init__(expressions)
+        self.procedures = procedures if procedures is not None else {}
 
-class Repetition(BaseExpression):
     def interpret(self, ctx):
-        loop = re.search(INT, ctx['code'])
-        count = int(loop.group())
-        ctx = {**ctx}
-        ctx['code'] = ctx['code'][loop.end():].strip()
-        for i in range(count):
-            Expression().interpret(ctx)
+        super().interpret({**ctx, 'procedures': self.procedures})
+
+
+def source(expression) -> str:
+    # canonical text of a tree, built with a stack so that deep nesting
+    # does not hit the recursion limit
+    parts, stack = [], [expression]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        elif isinstance(item, Repetition):
+            stack += [' end', item.body, f'loop {item.count} ']
+        elif isinstance(item, Procedure):
+            stack += [' end', item.body, f'def {item.name} ']
+        elif isinstance(item, Sequence):
+            for index in range(len(item.expressions) - 1, -1, -1):
+                stack.append(item.expressions[index])
+                if index:
+                    stack.append('; ')
+        else:
+            parts.append(repr(item))
+    return ''.join(parts)
+
+
+class Parser:
+    # commands have no state so one node per command is shared by all trees
+    commands = {
+        'right': RightCommand(),
+        'left': LeftCommand(),
+        'up': UpCommand(),
+        'down': DownCommand(),
+        'paint': PaintCommand(),
+    }
+
+    keywords = ('loop', 'end', 'def')
+
+    def tokenize(self, code: str):
+        return re.findall(TOKEN, code)
+
+    def parse(self, code: str) -> Program:
+        program = Program()
+        body = program.expressions
+        # bodies of the enclosing sequences of open loops and definitions
+        outer = []
+        procedure = None
+        # procedure name -> names it calls, '' stands for the program
+        calls = {'': set()}
+        expect_separator = False
+
+        tokens = iter(self.tokenize(code))
+        for token in tokens:
+            if token == ';':
+                expect_separator = False
+                continue
+            if expect_separator and token != 'end':
+                raise SyntaxError(f'expected ";" before {token!r}')
+
+            if token == 'loop':
+                count = next(tokens, '')
+                if not re.fullmatch(INT, count):
+                    raise SyntaxError(f'loop expects a count, got {count!r}')
+                repetition = Repetition(int(count), Sequence())
+                body.append(repetition)
+                outer.append(body)
+                body = repetition.body.expressions
+            elif token == 'def':
+                if outer:
+                    raise SyntaxError('def is only allowed at the top level')
+                name = next(tokens, '')
+                if not self.is_name(name):
+                    raise SyntaxError(f'def expects a name, got {name!r}')
+                if name in program.procedures:
+                    raise SyntaxError(f'{name!r} is already defined')
+                procedure = Procedure(name, Sequence())
+                program.procedures[name] = procedure
+                calls[name] = set()
+                body.append(procedure)
+                outer.append(body)
+                body = procedure.body.expressions
+            elif token == 'end':
+                if not outer:
+                    raise SyntaxError('end without loop or def')
+                body = outer.pop()
+                if not outer:
+                    procedure = None
+                expect_separator = True
+            elif token in self.commands:
+                body.append(self.commands[token])
+                expect_separator = True
+            elif self.is_name(token):
+                calls[procedure.name if procedure else ''].add(token)
+                body.append(Call(token))
+                expect_separator = True
+            else:
+                raise SyntaxError(f'unknown command {token!r}')
+
+        if procedure is not None:
+            raise SyntaxError(f'def {procedure.name} without end')
+        self.check_calls(calls)
+        return program
+
+    def is_name(self, token: str):
+        return (
+            re.fullmatch('[a-z]+', token) is not None
+            and token not in self.keywords and token not in self.commands
+        )
+
+    def check_calls(self, calls: dict):
+        unknown = set().union(*calls.values()) - calls.keys()
+        if unknown:
+            raise SyntaxError(f'unknown procedure {min(unknown)!r}')
+
+        # depth first search without recursion, a procedure met again while
+        # it is still on the path calls itself
+        done = set()
+        for root in calls:
+            path, stack = [root], [iter(calls[root])]
+            while stack:
+                callee = next(stack[-1], None)
+                if callee is None:
+                    done.add(path.pop())
+                    stack.pop()
+                elif callee in path:
+                    raise SyntaxError(f'recursive procedure {callee!r}')
+                elif callee not in done:
+                    path.append(callee)
+                    stack.append(iter(calls[callee]))
+
+
+class Expression(BaseExpression):
+    def interpret(self, ctx):
+        self.parse(ctx['code']).interpret(ctx)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def parse(code: str) -> Program:
+        # unchanged source text reuses the tree built on the first run
+        return Parser().parse(code)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def compile(code: str) -> tuple:
+        program = Expression.parse(code)
+        return Compiler(program.procedures).compile(program)
+
+
+class Compiler:
+    # most paint offsets a loop is unrolled into
+    MAX_STAMP = 1 << 16
+
+    def __init__(self, procedures=None):
+        self.procedures = procedures if procedures is not None else {}
+
+    def compile(self, program: Sequence) -> tuple:
+        return tuple(self.link(self.build(program)))
+
+    def build(self, sequence: Sequence) -> list:
+        ops = []
+        # explicit stack of (expressions, pc of LOOP_START) instead of recursion
+        stack = [(iter(sequence.expressions), None)]
+        while stack:
+            expressions, start = stack[-1]
+            expr = next(expressions, None)
+            if expr is None:
+                stack.pop()
+                if start is not None:
+                    ops.append((LOOP_END, None, 0))
+            elif isinstance(expr, Repetition):
+                stack.append((iter(expr.body.expressions), len(ops)))
+                ops.append((LOOP_START, expr.count, None))
+            elif isinstance(expr, Call):
+                for op in self.block(expr.name):
+                    self.emit(ops, op)
+            elif not isinstance(expr, Procedure):
+                self.emit(ops, expr.opcode)
+        return self.fold_loops(ops)
+
+    def block(self, name: str) -> list:
+        # a call costs the cached net effect of the body: one STAMP of its
+        # paints relative to the robot and one MOVE for its displacement
+        procedure = self.procedures[name]
+        if procedure.block is None:
+            block = self.build(procedure.body)
+            if all(op[0] in (MOVE, PAINT, STAMP) for op in block):
+                block = self.repeat(block, 1)
+            procedure.block = block
+        return procedure.block
+
+    def emit(self, ops: list, op: tuple):
+        # peephole: `right; right; up` becomes a single (MOVE, 16, -8)
+        if op[0] == MOVE:
+            if ops and ops[-1][0] == MOVE:
+                _, dx, dy = ops.pop()
+                op = (MOVE, dx + op[1], dy + op[2])
+            if not op[1] and not op[2]:
+                return
+        ops.append(op)
+
+    def fold_loops(self, ops: list) -> list:
+        # innermost loops first, so a folded inner loop lets the outer one fold
+        folded, starts = [], []
+        for op in ops:
+            if op[0] == LOOP_START:
+                starts.append(len(folded))
+                folded.append(op)
+            elif op[0] == LOOP_END:
+                start = starts.pop()
+                body = folded[start + 1:]
+                if all(body_op[0] in (MOVE, PAINT, STAMP) for body_op in body):
+                    count = folded[start][1]
+                    del folded[start:]
+                    for body_op in self.repeat(body, count):
+                        self.emit(folded, body_op)
+                else:
+                    folded.append(op)
+            else:
+                self.emit(folded, op)
+        return folded
+
+    def repeat(self, body: list, count: int) -> list:
+        # a loop without control flow is its net move plus paints along
+        # an arithmetic progression of that move
+        dx, dy, offsets = 0, 0, []
+        for op, a, b in body:
+            if op == MOVE:
+                dx, dy = dx + a, dy + b
+            elif op == PAINT:
+                offsets.append(np.array([[dx, dy]]))
+            else:
+                offsets.append(a + (dx, dy))
+        if not count:
+            return []
+        if not offsets:
+            return [(MOVE, dx * count, dy * count)]
+
+        offsets = np.concatenate(offsets)
+        # a loop that comes back to its start paints the same spots every
+        # time and painting twice at the same spot changes nothing
+        if not dx and not dy:
+            return [(STAMP, offsets, 0)]
+
+        def progression(times):
+            steps = np.arange(times)[:, None, None] * np.array((dx, dy))
+            return [
+                (STAMP, (steps + offsets).reshape(-1, 2), 0),
+                (MOVE, dx * times, dy * times),
+            ]
+
+        # long loops are unrolled in chunks of at most MAX_STAMP paints
+        unroll = max(self.MAX_STAMP // len(offsets), 1)
+        if count <= unroll:
+            return progression(count)
+        ops = [
+            (LOOP_START, count // unroll, None),
+            *progression(unroll),
+            (LOOP_END, None, 0),
+        ]
+        if count % unroll:
+            ops.extend(progression(count % unroll))
+        return ops
+
+    def link(self, ops: list) -> list:
+        starts = []
+        for pc, op in enumerate(ops):
+            if op[0] == LOOP_START:
+                starts.append(pc)
+            elif op[0] == LOOP_END:
+                start = starts.pop()
+                ops[start] = (LOOP_START, ops[start][1], pc + 1)
+                ops[pc] = (LOOP_END, start + 1, 0)
+        return ops
+
+
+class Machine:
+    def __init__(self):
+        self.load((), {})
+
+    def load(self, ops: tuple, ctx):
+        self.ops, self.ctx = ops, ctx
+        self.pc, self.counters = 0, []
+
+    @property
+    def done(self):
+        return self.pc >= len(self.ops)
+
+    def run(self, ops: tuple, ctx):
+        self.load(ops, ctx)
+        self.step()
+
+    def step(self, budget=None) -> int:
+        # runs at most budget opcodes and returns how many were run
+        if self.done:
+            return 0
+        ops, counters = self.ops, self.counters
+        backend = self.ctx['backend']
+        move, paint, stamp = backend.move, backend.paint, backend.stamp
+        pc, end = self.pc, len(ops)
+        executed = 0
+        for executed in (range(budget) if budget else itertools.count()):
+            if pc >= end:
+                break
+            op, a, b = ops[pc]
+            if op == MOVE:
+                move(a, b)
+            elif op == PAINT:
+                paint()
+            elif op == STAMP:
+                stamp(a)
+            elif op == LOOP_START:
+                if not a:
+                    pc = b
+                    continue
+                counters.append(a)
+            else:
+                counters[-1] -= 1
+                if counters[-1]:
+                    pc = a
+                    continue
+                counters.pop()
+            pc += 1
+        else:
+            executed = budget
+        self.pc = pc
+        return executed
+
+    @staticmethod
+    def count(ops: tuple) -> int:
+        # how many opcodes a run of the program dispatches
+        total, repeats = 0, [1]
+        for op, a, b in ops:
+            if op == LOOP_START:
+                total += repeats[-1]
+                repeats.append(repeats[-1] * a)
+            elif op == LOOP_END:
+                total += repeats.pop()
+            else:
+                total += repeats[-1]
+        return total
+
+
+class Backend(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    def move(self, dx, dy):
+        pass
+
+    @abc.abstractmethod
+    def paint(self):
+        pass
+
+    @abc.abstractmethod
+    def stamp(self, offsets):
+        pass
+
+    @abc.abstractmethod
+    def flush(self):
+        pass
+
+class RasterBackend(Backend):
+    background = (190, 190, 190)
+    color = (0, 128, 255)
+    brush = 4
+
+    SMALL_STAMP = 16
+    UNPAINTED = np.iinfo(np.int32).max
+    owner = None
+    epoch = 0
+
+    def __init__(self, width=384, height=256, x=128, y=64):
+        self.x, self.y = x, y
+        self.pixels = np.full((height, width, 3), self.background, np.uint8)
+
+    def move(self, dx, dy):
+        self.x += dx
+        self.y += dy
+
+    def paint(self):
+        self.paint_at(self.x, self.y)
+
+    def paint_at(self, x, y):
+        # brush is centered on the robot like the canvas path image
+        x0, y0 = x - self.brush // 2, y - self.brush // 2
+        region = (
+            slice(max(y0, 0), max(y0 + self.brush, 0)),
+            slice(max(x0, 0), max(x0 + self.brush, 0))
+        )
+        self.pixels[region] = self.color
+        if self.owner is not None:
+            np.minimum(self.owner[region], self.epoch, out=self.owner[region])
+
+    def stamp(self, offsets):
+        if len(offsets) <= self.SMALL_STAMP:
+            # a few paints are cheaper one by one than as array operations
+            for dx, dy in offsets.tolist():
+                self.paint_at(self.x + dx, self.y + dy)
+        else:
+            self.paint_points(offsets + (self.x, self.y))
+
+    def paint_points(self, points):
+        # paints at many absolute positions in one vectorised pass
+        height, width, _ = self.pixels.shape
+        brush = np.arange(self.brush) - self.brush // 2
+        xs = points[:, 0, None] + np.tile(brush, self.brush)
+        ys = points[:, 1, None] + np.repeat(brush, self.brush)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        region = (ys[inside], xs[inside])
+        self.pixels[region] = self.color
+        if self.owner is not None:
+            self.owner[region] = np.minimum(self.owner[region], self.epoch)
+
+    def track(self):
+        # remember the earliest epoch (statement) that painted each pixel
+        # so everything painted since a given epoch can be undone
+        self.base = self.pixels.copy()
+        self.owner = np.full(self.pixels.shape[:2], self.UNPAINTED, np.int32)
+        self.epoch = 0
+
+    def rewind(self, epoch, x, y):
+        painted = (self.owner >= epoch) & (self.owner != self.UNPAINTED)
+        self.pixels[painted] = self.base[painted]
+        self.owner[painted] = self.UNPAINTED
+        self.x, self.y = x, y
+
+    def flush(self):
+        pass
+
+    def save(self, path):
+        Image.fromarray(self.pixels).save(path)
+
+class TkBackend(RasterBackend):
+    # paints into one backing image and shows the changes once per frame
+    def __init__(self, app, x=128, y=64):
+        canvas = app.canvas
+        super().__init__(int(canvas['width']), int(canvas['height']), x, y)
+        self.canvas, self.robot = canvas, None
+        self.image = ImageTk.PhotoImage(Image.fromarray(self.pixels))
+        canvas.create_image(0, 0, anchor=tk.NW, image=self.image)
+        self.dirty = None
+
+    def mark(self, x0, y0, x1, y1):
+        # grow the dirty rectangle (pixels, end exclusive) shown on flush
+        if self.dirty is not None:
+            dirty = self.dirty
+            x0, y0 = min(dirty[0], x0), min(dirty[1], y0)
+            x1, y1 = max(dirty[2], x1), max(dirty[3], y1)
+        self.dirty = [x0, y0, x1, y1]
+
+    def paint_at(self, x, y):
+        super().paint_at(x, y)
+        x0, y0 = x - self.brush // 2, y - self.brush // 2
+        self.mark(x0, y0, x0 + self.brush, y0 + self.brush)
+
+    def paint_points(self, points):
+        super().paint_points(points)
+        if len(points):
+            x0, y0 = points.min(axis=0) - self.brush // 2
+            x1, y1 = points.max(axis=0) - self.brush // 2
+            self.mark(x0, y0, x1 + self.brush, y1 + self.brush)
+
+    def rewind(self, epoch, x, y):
+        super().rewind(epoch, x, y)
+        height, width, _ = self.pixels.shape
+        self.mark(0, 0, width, height)
+
+    def flush(self):
+        if self.dirty is not None:
+            height, width, _ = self.pixels.shape
+            x0, y0, x1, y1 = self.dirty
+            x0, y0 = min(max(x0, 0), width), min(max(y0, 0), height)
+            x1, y1 = max(min(x1, width), x0), max(min(y1, height), y0)
+            if x1 > x0 and y1 > y0:
+                patch = ImageTk.PhotoImage(
+                    Image.fromarray(self.pixels[y0:y1, x0:x1])
+                )
+                self.canvas.tk.call(
+                    str(self.image), 'copy', str(patch), '-to', x0, y0
+                )
+            self.dirty = None
+        # one coords call however many moves happened in the frame
+        self.canvas.coords(self.robot, self.x, self.y)
+
+
+class IncrementalRunner:
+    # keeps the robot position before every top level statement, so an
+    # edited program only runs the statements after the first change
+    def __init__(self, backend: RasterBackend):
+        self.backend = backend
+        self.commit()
+
+    def commit(self):
+        # the current canvas and position become the start of the program
+        self.keys = []
+        self.positions = []
+        self.definitions = []
+        self.backend.track()
+
+    def pending(self, code: str) -> list:
+        # rewinds to the first changed statement and returns
+        # (epoch, key, ops) of every statement that has to run again
+        program = Expression.parse(code)
+        statements = program.expressions
+        keys = [source(statement) for statement in statements]
+        definitions = [
+            key for key, statement in zip(keys, statements)
+            if isinstance(statement, Procedure)
+        ]
+
+        same = 0
+        # a changed definition may change calls before it as well as after
+        if definitions == self.definitions:
+            for old, new in zip(self.keys, keys):
+                if old != new:
+                    break
+                same += 1
+        self.definitions = definitions
+        if same < len(self.keys):
+            self.backend.rewind(same, *self.positions[same])
+            del self.keys[same:], self.positions[same:]
+
+        compiler = Compiler(program.procedures)
+        return [
+            (epoch, keys[epoch], compiler.compile(Sequence([statements[epoch]])))
+            for epoch in range(same, len(keys))
+        ]
+
+    def begin(self, epoch: int):
+        # an unfinished statement never matches, so it runs again next time
+        self.keys.append(None)
+        self.positions.append((self.backend.x, self.backend.y))
+        self.backend.epoch = epoch
+
+    def finish(self, epoch: int, key: str):
+        self.keys[epoch] = key
+
+    def run(self, code: str):
+        machine, ctx = Machine(), {'backend': self.backend}
+        for epoch, key, ops in self.pending(code):
+            self.begin(epoch)
+            machine.run(ops, ctx)
+            self.finish(epoch, key)
+
+
+class Executor:
+    # runs pending statements a budget of opcodes per Tk tick, so the window
+    # keeps handling events while a long program is drawn
+    def __init__(self, app, runner: IncrementalRunner, budget=50000, fps=30):
+        self.app, self.runner = app, runner
+        self.budget, self.fps = budget, fps
+        self.machine = Machine()
+        self.statements, self.current = [], None
+        self.job = None
+        self.executed = self.total = 0
+
+    @property
+    def running(self):
+        return self.job is not None
+
+    def start(self, code: str):
+        self.cancel()
+        self.statements = self.runner.pending(code)
+        self.statements.reverse()
+        self.machine.load((), {})
+        self.current = None
+        self.executed = 0
+        self.total = sum(Machine.count(ops) for _, _, ops in self.statements)
+        self.job = self.app.after_idle(self.tick)
+
+    def cancel(self):
+        if self.job is not None:
+            self.app.after_cancel(self.job)
+            self.job = None
+            self.app.progress(self.executed, self.total)
+
+    def tick(self):
+        started = time.perf_counter()
+        ctx = {'backend': self.runner.backend}
+        left = self.budget
+        while left:
+            if self.machine.done:
+                if self.current is not None:
+                    self.runner.finish(*self.current)
+                    self.current = None
+                if not self.statements:
+                    break
+                epoch, key, ops = self.statements.pop()
+                self.runner.begin(epoch)
+                self.machine.load(ops, ctx)
+                self.current = (epoch, key)
+            executed = self.machine.step(left)
+            self.executed += executed
+            left -= executed
+
+        self.runner.backend.flush()
+        self.app.progress(self.executed, self.total)
+        if self.current is None and not self.statements:
+            self.job = None
+            return
+        # frame rate cap: the next tick waits for the rest of the frame
+        elapsed = int((time.perf_counter() - started) * 1000)
+        self.job = self.app.after(max(1000 // self.fps - elapsed, 1), self.tick)
+
+
+class Swarm:
+    # many robots stepped together by one scheduler: every tick runs the
+    # next move or paint of all robots with a few NumPy operations
+    HALT = -1
+
+    def __init__(self, codes, positions, backend: RasterBackend):
+        self.backend = backend
+
+        # programs are packed into one opcode table, robots running the same
+        # source share its rows and STAMP keeps the index of its offsets
+        code, a, b, self.stamps = [], [], [], []
+        programs, starts, ends, depth = {}, [], [], 0
+        for source in codes:
+            if source not in programs:
+                base, level = len(code), 0
+                for op, x, y in Expression.compile(source):
+                    if op == STAMP:
+                        self.stamps.append(x)
+                        x = len(self.stamps) - 1
+                    elif op == LOOP_START:
+                        y += base
+                        level += 1
+                        depth = max(depth, level)
+                    elif op == LOOP_END:
+                        x += base
+                        level -= 1
+                    code.append(op)
+                    a.append(x)
+                    b.append(y)
+                programs[source] = (base, len(code))
+            start, end = programs[source]
+            starts.append(start)
+            ends.append(end)
+
+        # a trailing HALT row keeps pc of finished robots a valid index
+        self.code = np.array(code + [self.HALT], dtype=np.int8)
+        self.a = np.array(a + [0], dtype=np.int64)
+        self.b = np.array(b + [0], dtype=np.int64)
+        self.pc = np.array(starts, dtype=np.int64)
+        self.end = np.array(ends, dtype=np.int64)
+        self.positions = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        self.positions = np.broadcast_to(
+            self.positions, (len(starts), 2)
+        ).copy()
+        self.counters = np.zeros((len(starts), depth + 1), dtype=np.int64)
+        self.depth = np.zeros(len(starts), dtype=np.int64)
+
+    @property
+    def done(self):
+        return bool((self.pc >= self.end).all())
+
+    def opcodes(self):
+        op = self.code[self.pc]
+        op[self.pc >= self.end] = self.HALT
+        return op
+
+    def settle(self):
+        # loop opcodes take no tick: move every robot on to its next action
+        pc, counters, depth = self.pc, self.counters, self.depth
+        while True:
+            op = self.opcodes()
+            starts = np.flatnonzero(op == LOOP_START)
+            ends = np.flatnonzero(op == LOOP_END)
+            if not starts.size and not ends.size:
+                return op
+
+            count = self.a[pc[starts]]
+            skip = count == 0
+            pc[starts[skip]] = self.b[pc[starts[skip]]]
+            enter = starts[~skip]
+            counters[enter, depth[enter]] = count[~skip]
+            depth[enter] += 1
+            pc[enter] += 1
+
+            top = depth[ends] - 1
+            counters[ends, top] -= 1
+            again = counters[ends, top] > 0
+            pc[ends[again]] = self.a[pc[ends[again]]]
+            leave = ends[~again]
+            depth[leave] -= 1
+            pc[leave] += 1
+
+    def tick(self):
+        pc, positions = self.pc, self.positions
+        op = self.settle()
+
+        moving = op == MOVE
+        positions[moving, 0] += self.a[pc[moving]]
+        positions[moving, 1] += self.b[pc[moving]]
+
+        painting = op == PAINT
+        if painting.any():
+            self.backend.paint_points(positions[painting])
+
+        stamping = np.flatnonzero(op == STAMP)
+        if stamping.size:
+            # one vectorised paint per distinct STAMP, not per robot
+            ids = self.a[pc[stamping]]
+            for index in np.unique(ids):
+                offsets = self.stamps[index]
+                robots = stamping[ids == index]
+                chunk = max(Compiler.MAX_STAMP // len(offsets), 1)
+                for first in range(0, len(robots), chunk):
+                    points = (
+                        positions[robots[first:first + chunk], None, :]
+                        + offsets
+                    )
+                    self.backend.paint_points(points.reshape(-1, 2))
+
+        pc[op != self.HALT] += 1
+
+    def run(self) -> int:
+        ticks = 0
+        while not self.done:
+            self.tick()
+            ticks += 1
+        return ticks
 
 
 class App(tk.Tk):
@@ -124,44 +886,204 @@ class App(tk.Tk):
             bg='gray', bd=1, highlightthickness=0
         )
         self.canvas.pack(side=tk.BOTTOM, expand=True)
+        self.backend = TkBackend(self)
 
-        robot_image = ImageTk.PhotoImage(
+        self.robot_image = ImageTk.PhotoImage(
             Image.new('RGB', (8, 8), (0, 255, 128))
         )
-        self.path_image =ImageTk.PhotoImage(
-            Image.new('RGB', (4, 4), (0, 128, 255))
-        )
 
-        self.robot = self.canvas.create_image(
-            128, 64, anchor=tk.CENTER, image=robot_image
+        self.robot = self.backend.robot = self.canvas.create_image(
+            128, 64, anchor=tk.CENTER, image=self.robot_image
         )
         self.entry = tk.Text(
             self, width=42, height=16, highlightthickness=0
         )
         self.entry.insert(tk.END, 'loop 5 paint; right; paint; down; paint;')
         self.entry.pack()
-        self.entry.bind(
-            '<Return>', lambda e: Expression().interpret(self.get_context())
-        )
+        self.runner = IncrementalRunner(self.backend)
+        self.executor = Executor(self, self.runner)
+        self.entry.bind('<Return>', lambda e: self.refresh())
+        self.bind('<Escape>', lambda e: self.executor.cancel())
+
+        self.progressbar = ttk.Progressbar(self, length=320, maximum=1)
+        self.progressbar.pack()
+        buttons = tk.Frame(self)
+        buttons.pack()
+        tk.Button(buttons, text='·', command=self.run).pack(side=tk.LEFT)
         tk.Button(
-            self,
-            text='·',
-            command=lambda: Expression().interpret(self.get_context())
-        ).pack()
+            buttons, text='×', command=self.executor.cancel
+        ).pack(side=tk.LEFT)
 
         self.mainloop()
 
-    def paint(self, x, y):
-        self.canvas.create_image(
-            x, y, anchor=tk.CENTER, image=self.path_image
-        )
+    def run(self):
+        # run the program again from where the robot stands now
+        self.executor.cancel()
+        self.runner.commit()
+        self.refresh()
+
+    def refresh(self):
+        self.executor.start(self.get_context()['code'])
+
+    def progress(self, executed, total):
+        self.progressbar['value'] = executed / total if total else 1
 
     def get_context(self):
         code = self.entry.get('1.0', 'end-1c')
 
-        return {'app': self, 'code': code}
+        return {'backend': self.backend, 'code': code}
 
-if __name__=='__main__':
-    App()
+class Benchmark:
+    # generates programs of a given shape and size and measures every way
+    # of running them headless, the table it writes is the baseline of the
+    # next run when used as a regression gate
+    shapes = ('flat', 'deep', 'paint', 'move', 'procedure')
+    runners = ('tree', 'machine', 'incremental', 'swarm')
+    columns = ('shape', 'runner', 'parse_ms', 'compile_ms', 'execute_ms', 'peak_kib')
+
+    def __init__(self, size=5000, repeat=3, seed=17):
+        self.size, self.repeat, self.seed = size, repeat, seed
+
+    def program(self, shape: str) -> str:
+        rnd = random.Random(self.seed)
+        moves = ('right', 'left', 'up', 'down')
+        if shape == 'deep':
+            # nested loops dispatching about size commands
+            depth = 8
+            count = max(round(self.size ** (1 / depth)), 2)
+            return 'loop {} '.format(count) * depth + 'right; paint' + ' end' * depth
+        if shape == 'procedure':
+            return (
+                'def step right; paint; down; paint end; '
+                + '; '.join('step' for _ in range(self.size // 4))
+            )
+        paints = {'flat': 0.2, 'paint': 0.8, 'move': 0.05}[shape]
+        return '; '.join(
+            'paint' if rnd.random() < paints else rnd.choice(moves)
+            for _ in range(self.size)
+        )
+
+    def execute(self, runner: str, code: str):
+        backend = RasterBackend()
+        if runner == 'tree':
+            Expression().interpret({'backend': backend, 'code': code})
+        elif runner == 'machine':
+            Machine().run(Expression.compile(code), {'backend': backend})
+        elif runner == 'incremental':
+            IncrementalRunner(backend).run(code)
+        else:
+            Swarm([code], [(backend.x, backend.y)], backend).run()
+        return backend
+
+    def timeit(self, function, *args, setup=None) -> float:
+        # setup() runs untimed before every repeat and returns the arguments
+        best = float('inf')
+        for _ in range(self.repeat):
+            if setup is not None:
+                args = setup()
+            started = time.perf_counter()
+            function(*args)
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
 
+    def measure(self) -> list:
+        rows = []
+        for shape in self.shapes:
+            code = self.program(shape)
+            parse = self.timeit(Parser().parse, code)
+            # a fresh tree every repeat, compiled procedure bodies are
+            # cached on the tree
+            compile = self.timeit(
+                lambda program: Compiler(program.procedures).compile(program),
+                setup=lambda: (Parser().parse(code),)
+            )
+            # warm the caches so execute times only the run itself
+            Expression.compile(code)
+            for runner in self.runners:
+                execute = self.timeit(self.execute, runner, code)
+                tracemalloc.start()
+                self.execute(runner, code)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows.append((shape, runner, parse, compile, execute, peak / 1024))
+        return rows
 
+    @classmethod
+    def table(cls, rows: list) -> str:
+        lines = ['{:<10} {:<12} {:>10} {:>10} {:>10} {:>10}'.format(*cls.columns)]
+        for row in rows:
+            lines.append(
+                '{:<10} {:<12} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.1f}'.format(*row)
+            )
+        return '\n'.join(lines) + '\n'
+
+    @classmethod
+    def read(cls, path: str) -> dict:
+        # (shape, runner) -> measured values of a table written by table()
+        with open(path) as file:
+            lines = file.read().splitlines()[1:]
+        return {
+            tuple(fields[:2]): tuple(map(float, fields[2:]))
+            for fields in map(str.split, lines) if fields
+        }
+
+    @classmethod
+    def regressions(cls, rows: list, baseline: dict, tolerance: float) -> list:
+        # every measured column is gated, parse and compile once per shape
+        slower = []
+        for shape, runner, *values in rows:
+            before = baseline.get((shape, runner))
+            if before is None:
+                continue
+            for column, old, new in zip(cls.columns[2:], before, values):
+                if new > old * (1 + tolerance):
+                    found = (shape, runner, column, old, new)
+                    if column in ('parse_ms', 'compile_ms'):
+                        found = (shape, '*', column, old, new)
+                        if any(item[:3] == found[:3] for item in slower):
+                            continue
+                    slower.append(found)
+        return slower
+
+    @classmethod
+    def main(cls, args) -> int:
+        parser = argparse.ArgumentParser(
+            prog='17interpreter.py bench',
+            description='Benchmark the robot language interpreters headless'
+        )
+        parser.add_argument('--size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--output', help='write the results table here')
+        parser.add_argument('--baseline', help='fail if slower than this table')
+        parser.add_argument('--tolerance', type=float, default=0.25)
+        options = parser.parse_args(args)
+
+        rows = cls(options.size, options.repeat).measure()
+        table = cls.table(rows)
+        print(table)
+        if options.output:
+            with open(options.output, 'w') as file:
+                file.write(table)
+
+        if options.baseline:
+            slower = cls.regressions(
+                rows, cls.read(options.baseline), options.tolerance
+            )
+            for shape, runner, column, before, after in slower:
+                print(f'Regression: {shape}/{runner} {column} {before:.3f} -> {after:.3f}')
+            return 1 if slower else 0
+        return 0
+
+
+if __name__=='__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        # 17interpreter.py bench [--output results.txt] [--baseline results.txt]
+        sys.exit(Benchmark.main(sys.argv[2:]))
+    elif len(sys.argv) == 3:
+        # headless: 17interpreter.py script.txt canvas.png
+        with open(sys.argv[1]) as file:
+            ctx = {'backend': RasterBackend(), 'code': file.read()}
+        Machine().run(Expression.compile(ctx['code']), ctx)
+        ctx['backend'].save(sys.argv[2])
+    else:
+        App()
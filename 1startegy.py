@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
 import abc
+import sys
+import time
+import tracemalloc
+
+import numpy as np
 
 print('\nDesign pattens')
 
@@ -100,23 +105,43 @@ print('\nAdvanced example - composition')
 
 # iterface
 class QuackBehanvior(metaclass=abc.ABCMeta):
+    # behaviors keep no state, no __dict__ per instance either
+    __slots__ = ()
+
+    # noise one quack makes
+    loudness = 0.0
+
     @abc.abstractmethod
     def quack(self):
         pass
 
+    def quack_all(self, noise, ducks):
+        # the whole group of ducks with this behavior at once
+        noise[ducks] += self.loudness
+
 
 # realizations
 class Quack(QuackBehanvior):
+    __slots__ = ()
+
+    loudness = 1.0
+
     def quack(self):
         print(f'{self}: I can quack!')
 
 
 class Squeak(QuackBehanvior):
+    __slots__ = ()
+
+    loudness = 0.5
+
     def quack(self):
         print(f'{self}: I can squeack!')
 
 
 class MuteQuack(QuackBehanvior):
+    __slots__ = ()
+
     def quack(self):
         print(f'{self}: ...')
 
@@ -124,30 +149,66 @@ class MuteQuack(QuackBehanvior):
 
 # iterface
 class FlyBehavior(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
+    # height gained by one flight
+    climb = 0.0
+
     @abc.abstractmethod
     def fly(self):
         pass
 
+    def fly_all(self, altitude, ducks):
+        # the whole group of ducks with this behavior at once
+        altitude[ducks] += self.climb
+
 
 # realizations
 class FlyWithWings(FlyBehavior):
+    __slots__ = ()
+
+    climb = 1.0
+
     def fly(self):
         print('I can fly with wings!')
 
 
 class RocketFly(FlyBehavior):
+    __slots__ = ()
+
+    climb = 10.0
+
     def fly(self):
         print('I can fly with a rocket!')
 
 
 
 class FlyNoWay(FlyBehavior):
+    __slots__ = ()
+
     def fly(self):
         print('I can\'t fly!')
 
+    def fly_all(self, altitude, ducks):
+        altitude[ducks] = 0.0
+
+
+
+class Behaviors:
+    # flyweights: one shared instance per stateless behavior class
+    __instances = dict()
+
+    @classmethod
+    def get(cls, behavior_class):
+        behavior = cls.__instances.get(behavior_class)
+        if behavior is None:
+            behavior = cls.__instances.setdefault(behavior_class, behavior_class())
+        return behavior
 
 
 class FlexDuck(metaclass=abc.ABCMeta):
+    __slots__ = ()
+
     def __str__(self):
         return self.__class__.__name__
 
@@ -184,9 +245,11 @@ class FlexDuck(metaclass=abc.ABCMeta):
 
 
 class RedheadDuck(FlexDuck):
+    __slots__ = ('_quack_behavior', '_fly_behavior')
+
     def __init__(self):
-        self._quack_behavior: QuackBehanvior = Quack()
-        self._fly_behavior: FlyBehavior = FlyWithWings()
+        self._quack_behavior: QuackBehanvior = Behaviors.get(Quack)
+        self._fly_behavior: FlyBehavior = Behaviors.get(FlyWithWings)
 
     @property
     def quack_behavior(self):
@@ -209,8 +272,11 @@ class RedheadDuck(FlexDuck):
 
 
 class ModelDuck(FlexDuck):
-    _quack_behavior: QuackBehanvior = MuteQuack()
-    _fly_behavior: FlyBehavior = FlyNoWay()
+    __slots__ = ('_quack_behavior', '_fly_behavior')
+
+    def __init__(self):
+        self._quack_behavior: QuackBehanvior = Behaviors.get(MuteQuack)
+        self._fly_behavior: FlyBehavior = Behaviors.get(FlyNoWay)
 
     @property
     def quack_behavior(self):
@@ -252,7 +318,7 @@ model.swim()
 model.performQuack()
 model.performFly()
 print('model set fly')
-model.fly_behavior = RocketFly()
+model.fly_behavior = Behaviors.get(RocketFly)
 model.performFly()
 
 print('-- set quack --')
@@ -264,7 +330,7 @@ repeater.swim()
 repeater.performQuack()
 repeater.performFly()
 print('repeater set quack')
-repeater.quack_behavior = Squeak()
+repeater.quack_behavior = Behaviors.get(Squeak)
 repeater.performQuack()
 
 print('model')
@@ -272,7 +338,7 @@ model.performQuack()
 
 
 class Decoy:
-    _quack_behavior: QuackBehanvior = Quack()
+    _quack_behavior: QuackBehanvior = Behaviors.get(Quack)
 
     def __str__(self):
         return self.__class__.__name__
@@ -294,6 +360,92 @@ print(fake)
 fake.performQuack()
 
 
+print('\nBulk execution - strategy per group of ducks')
+
+
+class Flock:
+    # struct of arrays: a behavior kind per duck indexes the behaviors list,
+    # ducks are grouped by kind and every strategy runs once per group
+    def __init__(self, fly_behaviors, quack_behaviors, fly_kinds, quack_kinds):
+        self.fly_behaviors = list(fly_behaviors)
+        self.quack_behaviors = list(quack_behaviors)
+        self.fly_kinds = np.asarray(fly_kinds, dtype=np.intp)
+        self.quack_kinds = np.asarray(quack_kinds, dtype=np.intp)
+        self.altitude = np.zeros(len(self.fly_kinds))
+        self.noise = np.zeros(len(self.quack_kinds))
+        self.__groups = dict()
+
+    @classmethod
+    def from_ducks(cls, ducks):
+        # ducks sharing a behavior class share one kind, behaviors keep
+        # no state so the first instance of the class stands for all
+        fly_behaviors, fly_kinds = cls.kinds(duck.fly_behavior for duck in ducks)
+        quack_behaviors, quack_kinds = cls.kinds(duck.quack_behavior for duck in ducks)
+        return cls(fly_behaviors, quack_behaviors, fly_kinds, quack_kinds)
+
+    @staticmethod
+    def kinds(behaviors):
+        found = dict()
+        kinds = [
+            found.setdefault(behavior.__class__, (len(found), behavior))[0]
+            for behavior in behaviors
+        ]
+        return [behavior for _, behavior in found.values()], kinds
+
+    def __len__(self):
+        return len(self.fly_kinds)
+
+    @staticmethod
+    def group(kinds, count):
+        # indexes of the ducks of every kind
+        order = np.argsort(kinds, kind='stable')
+        bounds = np.searchsorted(kinds[order], np.arange(count + 1))
+        return [order[bounds[kind]:bounds[kind + 1]] for kind in range(count)]
+
+    def groups(self, name):
+        # computed once, until some ducks change behavior
+        if name not in self.__groups:
+            if name == 'fly':
+                self.__groups[name] = self.group(self.fly_kinds, len(self.fly_behaviors))
+            else:
+                self.__groups[name] = self.group(self.quack_kinds, len(self.quack_behaviors))
+        return self.__groups[name]
+
+    @staticmethod
+    def kind(behaviors, behavior):
+        for index, known in enumerate(behaviors):
+            if known.__class__ is behavior.__class__:
+                return index
+        behaviors.append(behavior)
+        return len(behaviors) - 1
+
+    def set_fly(self, ducks, fly_behavior: FlyBehavior):
+        self.fly_kinds[ducks] = self.kind(self.fly_behaviors, fly_behavior)
+        self.__groups.pop('fly', None)
+
+    def set_quack(self, ducks, quack_behavior: QuackBehanvior):
+        self.quack_kinds[ducks] = self.kind(self.quack_behaviors, quack_behavior)
+        self.__groups.pop('quack', None)
+
+    def tick(self):
+        for behavior, ducks in zip(self.fly_behaviors, self.groups('fly')):
+            if len(ducks):
+                behavior.fly_all(self.altitude, ducks)
+        for behavior, ducks in zip(self.quack_behaviors, self.groups('quack')):
+            if len(ducks):
+                behavior.quack_all(self.noise, ducks)
+
+
+flock = Flock.from_ducks([redhead, model, repeater, RedheadDuck(), ModelDuck()])
+flock.tick()
+flock.set_fly([1, 4], Behaviors.get(RocketFly))
+flock.tick()
+flock.set_fly([0], Behaviors.get(FlyNoWay))
+flock.tick()
+print('altitude', flock.altitude)
+print('noise', flock.noise)
+
+
 print('\nHierarchy')
 
 
@@ -353,3 +505,82 @@ print(t)
 t.set_weapon = AxeBehavior()
 t.fight()
 
+
+def benchmark_flock(ducks=1_000_000, ticks=10):
+    print('\nBenchmark - one tick of a million ducks')
+
+    rng = np.random.default_rng(0)
+    fly_behaviors = [Behaviors.get(kind) for kind in (FlyWithWings, RocketFly, FlyNoWay)]
+    quack_behaviors = [Behaviors.get(kind) for kind in (Quack, Squeak, MuteQuack)]
+    flock = Flock(
+        fly_behaviors, quack_behaviors,
+        rng.integers(0, 3, ducks), rng.integers(0, 3, ducks)
+    )
+
+    # the same flock as objects, each going through its properties
+    population = []
+    for fly_kind, quack_kind in zip(flock.fly_kinds.tolist(), flock.quack_kinds.tolist()):
+        duck = RedheadDuck()
+        duck.fly_behavior = fly_behaviors[fly_kind]
+        duck.quack_behavior = quack_behaviors[quack_kind]
+        population.append(duck)
+
+    altitude = [0.0] * ducks
+    noise = [0.0] * ducks
+    started = time.perf_counter()
+    for _ in range(ticks):
+        for index, duck in enumerate(population):
+            fly_behavior = duck.fly_behavior
+            if isinstance(fly_behavior, FlyNoWay):
+                altitude[index] = 0.0
+            else:
+                altitude[index] += fly_behavior.climb
+            noise[index] += duck.quack_behavior.loudness
+    per_duck = (time.perf_counter() - started) / ticks
+
+    started = time.perf_counter()
+    for _ in range(ticks):
+        flock.tick()
+    grouped = (time.perf_counter() - started) / ticks
+
+    print(f'per duck: {per_duck * 1000:>8.1f} ms per tick')
+    print(
+        f'grouped:  {grouped * 1000:>8.1f} ms per tick, '
+        f'{len(fly_behaviors) + len(quack_behaviors)} strategy calls'
+    )
+    print(
+        'same result:',
+        np.allclose(flock.altitude, altitude) and np.allclose(flock.noise, noise)
+    )
+
+
+def benchmark_duck_memory(ducks=1_000_000):
+    print('\nBenchmark - memory of a million ducks')
+
+    # the ducks as they were: a __dict__ each and their own behaviors
+    class DictQuack(Quack):
+        pass
+
+    class DictFlyWithWings(FlyWithWings):
+        pass
+
+    class DictRedheadDuck(RedheadDuck):
+        def __init__(self):
+            self._quack_behavior = DictQuack()
+            self._fly_behavior = DictFlyWithWings()
+
+    for name, duck_class in (
+        ('dict, own behaviors', DictRedheadDuck),
+        ('slots, shared behaviors', RedheadDuck),
+    ):
+        tracemalloc.start()
+        flock = [duck_class() for _ in range(ducks)]
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:>24}: {current / ducks:>6.1f} bytes per duck')
+        del flock
+
+
+if __name__ == '__main__' and 'bench' in sys.argv[1:]:
+    benchmark_flock()
+    benchmark_duck_memory()
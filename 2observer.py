@@ -1,20 +1,41 @@
 #!/usr/bin/env python3
 
 import abc
+import atexit
+import collections
+import concurrent.futures
+import itertools
 import datetime
+import functools
+import math
+import os
+import queue
 import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import weakref
 
-print('\nDesign pattens')
+import numpy as np
 
-print('1 separate permanent and incapsulate flexible data/algorithms')
-print('2 programm on the interface (abstract) level not realization')
-print('3 composition better than inheritance')
-print('4 Weak references')
+# the examples run from the main block at the end, worker processes of the
+# fleet import this file and must not run them
 
-print('\nObserver')
-print('When state of one object changed related object has been notified')
+def introduction():
+    print('\nDesign pattens')
+
+    print('1 separate permanent and incapsulate flexible data/algorithms')
+    print('2 programm on the interface (abstract) level not realization')
+    print('3 composition better than inheritance')
+    print('4 Weak references')
+
+    print('\nObserver')
+    print('When state of one object changed related object has been notified')
 
-print('\nSimple example - concrete realization')
 
 class CurrentConditionDisplay:
     def update(self, temp, humidity, pressure):
@@ -73,15 +94,102 @@ class WeatherData:
 
 weather_data = WeatherData()
 
-weather_data.mesurement_changed()
 
+def simple_example():
+    print('\nSimple example - concrete realization')
+    weather_data.mesurement_changed()
+
+
+class Measurement:
+    # immutable snapshot pushed to every observer, one per change
+    __slots__ = ('temp', 'humidity', 'pressure')
+
+    def __init__(self, temp, humidity, pressure):
+        object.__setattr__(self, 'temp', temp)
+        object.__setattr__(self, 'humidity', humidity)
+        object.__setattr__(self, 'pressure', pressure)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __eq__(self, other):
+        if not isinstance(other, Measurement):
+            return NotImplemented
+        return (
+            (self.temp, self.humidity, self.pressure)
+            == (other.temp, other.humidity, other.pressure)
+        )
+
+    def __hash__(self):
+        return hash((self.temp, self.humidity, self.pressure))
+
+    def changed(self, other):
+        # names of the fields that differ from an earlier measurement
+        if other is None:
+            return self.__slots__
+        return tuple(
+            name for name in self.__slots__
+            if getattr(self, name) != getattr(other, name)
+        )
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.temp}, {self.humidity}, {self.pressure})'
+
+
+class MeasurementBatch:
+    # many readings pushed at once as read-only column arrays, with the
+    # time of every reading in seconds since the epoch when it is known
+    FIELDS = Measurement.__slots__
+    __slots__ = FIELDS + ('times',)
+
+    def __init__(self, temp, humidity, pressure, times=None):
+        columns = [
+            np.array(column, dtype=float)
+            for column in (temp, humidity, pressure, times) if column is not None
+        ]
+        if columns[0].ndim != 1 or any(c.shape != columns[0].shape for c in columns):
+            raise ValueError('Batch columns must be one-dimensional and of equal length')
+        if not len(columns[0]):
+            raise ValueError('Batch is empty')
+        if times is not None and np.any(np.diff(columns[-1]) < 0):
+            raise ValueError('Batch times must be in order')
+        object.__setattr__(self, 'times', None)
+        for name, column in zip(self.__slots__, columns):
+            column.setflags(write=False)
+            object.__setattr__(self, name, column)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __len__(self):
+        return len(self.temp)
+
+    def __getitem__(self, index):
+        return Measurement(
+            self.temp[index].item(),
+            self.humidity[index].item(),
+            self.pressure[index].item()
+        )
+
+    def last(self):
+        return self[-1]
+
+    def changed(self, other):
+        # names of the fields with any reading that differs from `other`
+        if other is None:
+            return self.FIELDS
+        return tuple(
+            name for name in self.FIELDS
+            if np.any(getattr(self, name) != getattr(other, name))
+        )
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({len(self)} readings)'
 
-print('\nAdvanced example - subscription')
-print('\none to many')
 
 class Observer(metaclass=abc.ABCMeta):
     @abc.abstractmethod
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         pass
 
 class DisplayElement(metaclass=abc.ABCMeta):
@@ -89,6 +197,9 @@ class DisplayElement(metaclass=abc.ABCMeta):
     def display(self):
         pass
 
+# an observer may also define update_batch(self, obs=None, batch=None) to take
+# a MeasurementBatch at once, the others get its last reading through update
+
 class WeakDisplay(Observer, DisplayElement):
     def __init__(self, weather_data):
         self.__weather_data = weather_data
@@ -97,6 +208,21 @@ class WeakDisplay(Observer, DisplayElement):
     def __str__(self):
         return self.__class__.__name__
 
+    @staticmethod
+    def measurement(obs=None, data=None, **kwargs):
+        # pushed snapshot, pulled from the subject or built from kwargs
+        if isinstance(data, Measurement):
+            return data
+        if isinstance(obs, WeatherData):
+            return Measurement(
+                obs.get_temperature(), obs.get_humidity(), obs.get_pressure()
+            )
+        return Measurement(
+            kwargs.get('temp', 0),
+            kwargs.get('humidity', 0),
+            kwargs.get('pressure', 0)
+        )
+
 
 class CurrentConditionWeakDisplay(WeakDisplay):
     def __init__(self, weather_data):
@@ -105,17 +231,13 @@ class CurrentConditionWeakDisplay(WeakDisplay):
         self.__humidity = 0
         self.__pressure = 0
 
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         print(f'\n-- Update: {self}')
 
-        if isinstance(obs, WeatherData):
-            self.__temp = obs.get_temperature()
-            self.__humidity = obs.get_humidity()
-            self.__pressure = obs.get_pressure()
-        else:
-            self.__temp = kwargs.get('temp', 0)
-            self.__humidity = kwargs.get('humidity', 0)
-            self.__pressure = kwargs.get('pressure', 0)
+        measurement = self.measurement(obs, data, **kwargs)
+        self.__temp = measurement.temp
+        self.__humidity = measurement.humidity
+        self.__pressure = measurement.pressure
 
         self.display()
         print('-- Done')
@@ -127,91 +249,327 @@ class CurrentConditionWeakDisplay(WeakDisplay):
         )
 
 
+class RingBuffer:
+    # the last `size` values with their running sum, O(1) per append
+    def __init__(self, size):
+        self.values = [0.0] * size
+        self.size = size
+        self.count = 0
+        self.next = 0
+        self.total = 0.0
+
+    def append(self, value):
+        if self.count == self.size:
+            self.total -= self.values[self.next]
+        else:
+            self.count += 1
+        self.values[self.next] = value
+        self.total += value
+        self.next = (self.next + 1) % self.size
+
+    def extend(self, values):
+        if len(values) < self.size:
+            for value in values:
+                self.append(float(value))
+            return
+        # the batch overwrites the whole window
+        self.values = [float(value) for value in values[-self.size:]]
+        self.count = self.size
+        self.next = 0
+        self.total = math.fsum(self.values)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class QuantileSketch:
+    # counts per bucket of `width`, the width doubles whenever there would be
+    # more than max_buckets, so memory is bounded whatever the value range
+    def __init__(self, width=0.5, max_buckets=256):
+        self.width = width
+        self.max_buckets = max_buckets
+        self.counts = dict()
+        self.count = 0
+
+    def add(self, value):
+        index = math.floor(value / self.width)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        if len(self.counts) > self.max_buckets:
+            self.coarsen()
+
+    def add_batch(self, values):
+        indexes, counts = np.unique(
+            np.floor(values / self.width).astype(np.int64), return_counts=True
+        )
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += len(values)
+        if len(self.counts) > self.max_buckets:
+            self.coarsen()
+
+    def coarsen(self):
+        while len(self.counts) > self.max_buckets:
+            self.width *= 2
+            merged = dict()
+            for index, count in self.counts.items():
+                merged[index // 2] = merged.get(index // 2, 0) + count
+            self.counts = merged
+
+    def quantile(self, q):
+        # middle of the bucket holding the q-th value, off by width/2 at most
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return (index + 0.5) * self.width
+
+
+class Moments:
+    # Welford count/mean/variance and min/max, small enough to send between
+    # processes and mergeable in any order
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+    def add_batch(self, values):
+        values = np.asarray(values, dtype=float)
+        if not len(values):
+            return
+        batch = Moments()
+        batch.count = len(values)
+        batch.mean = values.mean().item()
+        batch.m2 = np.square(values - batch.mean).sum().item()
+        batch.minimum = values.min().item()
+        batch.maximum = values.max().item()
+        self.merge(batch)
+
+    def merge(self, other):
+        # Chan et al. merge of the other mean/variance into the running ones
+        if not other.count:
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def __str__(self):
+        if not self.count:
+            return '0'
+        return (
+            f'{self.mean} (min {self.minimum}, max {self.maximum}, '
+            f'std {self.std:.2f})'
+        )
+
+
+class StreamingStatistics(Moments):
+    # constant memory and O(1) updates however long the station runs:
+    # moments, a sliding window and a quantile sketch
+    def __init__(self, window=60):
+        super().__init__()
+        self.window = RingBuffer(window)
+        self.sketch = QuantileSketch()
+
+    def add(self, value):
+        super().add(value)
+        self.window.append(value)
+        self.sketch.add(value)
+
+    def add_batch(self, values):
+        values = np.asarray(values, dtype=float)
+        super().add_batch(values)
+        self.window.extend(values)
+        self.sketch.add_batch(values)
+
+    @property
+    def median(self):
+        return self.sketch.quantile(0.5)
+
+    def __str__(self):
+        if not self.count:
+            return '0'
+        return (
+            f'{self.mean} (min {self.minimum}, max {self.maximum}, '
+            f'std {self.std:.2f}, median ~{self.median}, '
+            f'last {self.window.count} {self.window.mean})'
+        )
+
+
 class StatisticWeakDisplay(WeakDisplay):
     def __init__(self, weather_data):
         super().__init__(weather_data)
-        self.__temp = []
-        self.__humidity = []
-        self.__pressure = []
+        self.__temp = StreamingStatistics()
+        self.__humidity = StreamingStatistics()
+        self.__pressure = StreamingStatistics()
 
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         print(f'\n-- Update: {self}')
 
-        if isinstance(obs, WeatherData):
-            self.__temp.append(obs.get_temperature())
-            self.__humidity.append(obs.get_humidity())
-            self.__pressure.append(obs.get_pressure())
+        measurement = self.measurement(obs, data, **kwargs)
+        self.__temp.add(measurement.temp)
+        self.__humidity.add(measurement.humidity)
+        self.__pressure.add(measurement.pressure)
 
-        else:
-            self.__temp.append(kwargs.get('temp', 0))
-            self.__humidity.append(kwargs.get('humidity', 0))
-            self.__pressure.append(kwargs.get('pressure', 0))
+        self.display()
+        print('-- Done')
+
+    def update_batch(self, obs=None, batch=None):
+        print(f'\n-- Update: {self} ({len(batch)} readings)')
+
+        self.__temp.add_batch(batch.temp)
+        self.__humidity.add_batch(batch.humidity)
+        self.__pressure.add_batch(batch.pressure)
 
         self.display()
         print('-- Done')
 
     def display(self):
         date = datetime.datetime.now()
-        av_temp = sum(self.__temp)/len(self.__temp) if self.__temp else 0
-        av_hum = sum(self.__humidity)/len(self.__humidity) if self.__pressure else 0
-        av_press = sum(self.__pressure)/len(self.__pressure) if self.__humidity else 0
         print(
-            f'{date}\nTemperature: {av_temp}\nHumidity: {av_hum}\nPressure: {av_press}'
+            f'{date}\nTemperature: {self.__temp}\nHumidity: {self.__humidity}\nPressure: {self.__pressure}'
         )
 
+class TrendEngine:
+    # least-squares slope of the last `window` readings of every field for
+    # many stations at once: a ring of shape (stations, window, fields) and
+    # running sums of y and x*y, with x counted from the oldest reading
+    def __init__(self, stations=1, window=16, fields=3):
+        self.window = window
+        self.values = np.zeros((stations, window, fields))
+        self.sum_y = np.zeros((stations, fields))
+        self.sum_xy = np.zeros((stations, fields))
+        self.count = 0
+        self.next = 0
+        self.appended = 0
+
+    def append(self, values):
+        # one reading per station, shape (stations, fields)
+        values = np.asarray(values, dtype=float)
+        if self.count == self.window:
+            oldest = self.values[:, self.next]
+            self.sum_y -= oldest
+            # the others move one step closer to x = 0
+            self.sum_xy -= self.sum_y
+            self.sum_xy += (self.window - 1) * values
+        else:
+            self.sum_xy += self.count * values
+            self.count += 1
+        self.sum_y += values
+        self.values[:, self.next] = values
+        self.next = (self.next + 1) % self.window
+        self.appended += 1
+        # rounding piles up in the running sums, start again from the ring
+        if self.appended % self.window == 0:
+            self.resum()
+
+    def extend(self, values):
+        # many readings per station, shape (stations, readings, fields)
+        values = np.asarray(values, dtype=float)[:, -self.window:]
+        if values.shape[1] < self.window:
+            for index in range(values.shape[1]):
+                self.append(values[:, index])
+            return
+        self.values[:] = values
+        self.count = self.window
+        self.next = 0
+        self.appended += values.shape[1]
+        self.resum()
+
+    def ordered(self):
+        # the window oldest first
+        if self.count < self.window:
+            return self.values[:, :self.count]
+        return np.roll(self.values, -self.next, axis=1)
+
+    def resum(self):
+        values = self.ordered()
+        x = np.arange(values.shape[1], dtype=float)
+        self.sum_y = values.sum(axis=1)
+        self.sum_xy = np.einsum('j,sjf->sf', x, values)
+
+    def slopes(self):
+        # change per reading, shape (stations, fields)
+        n = self.count
+        if n < 2:
+            return np.zeros_like(self.sum_y)
+        sum_x = n * (n - 1) / 2
+        sum_xx = (n - 1) * n * (2 * n - 1) / 6
+        return (n * self.sum_xy - sum_x * self.sum_y) / (n * sum_xx - sum_x * sum_x)
+
+    def directions(self, tolerance=1e-9):
+        # -1 falling, 0 steady, 1 rising
+        slopes = self.slopes()
+        return np.where(np.abs(slopes) <= tolerance, 0, np.sign(slopes)).astype(int)
+
+
 class ForecastWeakDisplay(WeakDisplay):
-    def __init__(self, weather_data):
+    # per field: name, then words for steady, rising and falling
+    TRENDS = (
+        ('Temperature', 'more of the same', 'becomes higher', 'becomes lower'),
+        ('Humidity', 'more of the same', 'increases', 'decreases'),
+        ('Pressure', 'more of the same', 'goes up', 'goes down'),
+    )
+
+    def __init__(self, weather_data, window=16):
         super().__init__(weather_data)
-        self.__temp = 0
-        self.__humidity = 0
-        self.__pressure = 0
-
-        self.__last_temp = None
-        self.__last_humidity = None
-        self.__last_pressure = None
+        self.__trend = TrendEngine(window=window)
 
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         print(f'\n-- Update: {self}')
 
-        self.__last_temp = self.__temp
-        self.__last_humidity = self.__humidity
-        self.__last_pressure = self.__pressure
+        measurement = self.measurement(obs, data, **kwargs)
+        self.__trend.append(
+            ((measurement.temp, measurement.humidity, measurement.pressure),)
+        )
 
-        if isinstance(obs, WeatherData):
-            self.__temp = obs.get_temperature()
-            self.__humidity = obs.get_humidity()
-            self.__pressure = obs.get_pressure()
-        else:
-            self.__temp = kwargs.get('temp', 0)
-            self.__humidity = kwargs.get('humidity', 0)
-            self.__pressure = kwargs.get('pressure', 0)
+        self.display()
+        print('-- Done')
+
+    def update_batch(self, obs=None, batch=None):
+        print(f'\n-- Update: {self} ({len(batch)} readings)')
+
+        # only the last window of the batch matters
+        window = slice(-self.__trend.window, None)
+        self.__trend.extend(np.stack(
+            (batch.temp[window], batch.humidity[window], batch.pressure[window]),
+            axis=-1
+        )[np.newaxis])
 
         self.display()
         print('-- Done')
 
     def display(self):
-        date = datetime.datetime.now()
         print('Forecast')
-        if self.__temp == self.__last_temp:
-            print('Temperature more of the same')
-        elif self.__temp > self.__last_temp:
-            print('Temperature becomes higher')
-        else:
-            print('Temperature becomes lower')
-
-        if self.__humidity == self.__last_humidity:
-            print('Humidity more of the same')
-        elif self.__humidity > self.__last_humidity:
-            print('Humidity increases')
-        else:
-            print('Humidity decreases')
-
-        if self.__pressure == self.__last_pressure:
-            print('Pressure more of the same')
-        elif self.__pressure > self.__last_pressure:
-            print('Pressure goes up')
-        else:
-            print('Pressure goes down')
+        slopes = self.__trend.slopes()[0]
+        directions = self.__trend.directions()[0]
+        for (name, *words), slope, direction in zip(self.TRENDS, slopes, directions):
+            print(f'{name} {words[direction]} ({slope:+.3f} per reading)')
 
 
 class HeatIndexWeakDisplay(WeakDisplay):
@@ -221,84 +579,701 @@ class HeatIndexWeakDisplay(WeakDisplay):
         self.__humidity = 0
         self.__pressure = 0
 
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         print(f'\n-- Update: {self}')
 
-        if isinstance(obs, WeatherData):
-            self.__temp = obs.get_temperature()
-            self.__humidity = obs.get_humidity()
-            self.__pressure = obs.get_pressure()
-        else:
-            self.__temp = kwargs.get('temp', 0)
-            self.__humidity = kwargs.get('humidity', 0)
-            self.__pressure = kwargs.get('pressure', 0)
+        measurement = self.measurement(obs, data, **kwargs)
+        self.__temp = measurement.temp
+        self.__humidity = measurement.humidity
+        self.__pressure = measurement.pressure
 
         self.display()
         print('-- Done')
 
-    @staticmethod
-    def get_heat_index(t, rh):
-        index = (
-            (16.923 + (0.185212 * t) + (5.37941 * rh) - (0.100254 * t * rh)
-                + (0.00941695 * (t * t))
-                + (0.00728898 * (rh * rh))
-                + (0.000345372 * (t * t * rh))
-                - (0.000814971 * (t * rh * rh))
-                + (0.0000102102 * (t * t * rh * rh))
-                - (0.000038646 * (t * t * t))
-                + (0.0000291583 *(rh * rh * rh))
-                + (0.00000142721 * (t * t * t * rh))
-                + (0.000000197483 * (t * rh * rh * rh))
-                - (0.0000000218429 * (t * t * t * rh * rh))
-                + 0.000000000843296 * (t * t * rh * rh * rh)
-            )
-            - (0.0000000000481975 * (t * t * t * rh * rh * rh))
+    def update_batch(self, obs=None, batch=None):
+        print(f'\n-- Update: {self} ({len(batch)} readings)')
+
+        rh = np.divide(
+            batch.humidity, batch.pressure,
+            out=np.zeros(len(batch)), where=batch.pressure != 0
         )
+        index = self.get_heat_index(batch.temp, rh)
+        measurement = batch.last()
+        self.__temp = measurement.temp
+        self.__humidity = measurement.humidity
+        self.__pressure = measurement.pressure
+
+        self.display()
+        print(f'Max Heat Index: {index.max()}')
+        print('-- Done')
+
+    # HEAT_INDEX[i][j] is the coefficient of t**i * rh**j
+    HEAT_INDEX = (
+        (16.923, 5.37941, 0.00728898, 0.0000291583),
+        (0.185212, -0.100254, -0.000814971, 0.000000197483),
+        (0.00941695, 0.000345372, 0.0000102102, 0.000000000843296),
+        (-0.000038646, 0.00000142721, -0.0000000218429, -0.0000000000481975),
+    )
+
+    @classmethod
+    def get_heat_index(cls, t, rh):
+        # Horner form in rh inside Horner form in t, numbers or NumPy arrays
+        index = 0
+        for row in reversed(cls.HEAT_INDEX):
+            a0, a1, a2, a3 = row
+            index = index * t + (((a3 * rh + a2) * rh + a1) * rh + a0)
         return index
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1 << 13)
+    def cached_heat_index(t, rh):
+        # coarse sensors repeat the same (t, rh) pairs
+        return HeatIndexWeakDisplay.get_heat_index(t, rh)
+
     def display(self):
         date = datetime.datetime.now()
         rh = self.__humidity/self.__pressure if self.__pressure else 0
         print(
-            f'{date}\nHeat Index: {self.get_heat_index(self.__temp, rh)}'
+            f'{date}\nHeat Index: {self.cached_heat_index(self.__temp, rh)}'
+        )
+
+
+class ReportWriter:
+    # observers only put records on a queue, a writer thread batches them and
+    # writes when batch_size records are waiting or flush_interval has passed
+    STOP = object()
+    RECORD = struct.Struct('<dddd')
+    CSV_HEADER = 'date,temperature,humidity,pressure\n'
+    # running writers, weakly, so the exit hook drains them without
+    # keeping closed ones alive
+    live = weakref.WeakSet()
+
+    def __init__(
+        self, file_name, format='text', batch_size=64, flush_interval=1.0,
+        max_bytes=1 << 20, backups=3
+    ):
+        if format not in ('text', 'csv', 'binary'):
+            raise ValueError(f'Unknown report format: {format}')
+        self.file_name = file_name
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+        self.__queue = queue.Queue()
+        self.__thread = threading.Thread(
+            target=self.__run, name=f'{self.__class__.__name__}:{file_name}',
+            daemon=True
         )
+        self.__thread.start()
+        ReportWriter.live.add(self)
+
+    @classmethod
+    def close_all(cls):
+        for writer in list(cls.live):
+            writer.close()
+
+    def write(self, date, measurement):
+        self.__queue.put((date, measurement))
+
+    def close(self):
+        if self.__thread.is_alive():
+            self.__queue.put(self.STOP)
+            self.__thread.join()
+
+    def encode(self, date, measurement):
+        if self.format == 'csv':
+            return (
+                f'{date.isoformat()},{measurement.temp},'
+                f'{measurement.humidity},{measurement.pressure}\n'
+            ).encode()
+        if self.format == 'binary':
+            return self.RECORD.pack(
+                date.timestamp(), measurement.temp,
+                measurement.humidity, measurement.pressure
+            )
+        return (
+            f'---\n{date}\nTemperature: {measurement.temp}\n'
+            f'Humidity: {measurement.humidity}\nPressure: {measurement.pressure}\n'
+        ).encode()
+
+    def __open(self):
+        file = open(self.file_name, 'ab')
+        if self.format == 'csv' and not file.tell():
+            file.write(self.CSV_HEADER.encode())
+        return file
+
+    def __rotate(self, file):
+        # file -> file.1 -> ... -> file.<backups>, the oldest is dropped
+        file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f'{self.file_name}.{index}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.file_name}.{index + 1}')
+        if self.backups:
+            os.replace(self.file_name, f'{self.file_name}.1')
+        else:
+            os.remove(self.file_name)
+        return self.__open()
+
+    def __flush(self, file, batch):
+        data = b''.join(self.encode(date, measurement) for date, measurement in batch)
+        if file.tell() and file.tell() + len(data) > self.max_bytes:
+            file = self.__rotate(file)
+        file.write(data)
+        file.flush()
+        return file
+
+    def __run(self):
+        file = self.__open()
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.__queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = None
+            if item is self.STOP:
+                break
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                if batch:
+                    file = self.__flush(file, batch)
+                    batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if batch:
+            file = self.__flush(file, batch)
+        file.close()
+
+
+atexit.register(ReportWriter.close_all)
 
 
 class ReportWeakDisplay(WeakDisplay):
-    def __init__(self, weather_data):
+    def __init__(self, weather_data, file_name='2observer-weak-weather.txt', format='text'):
         super().__init__(weather_data)
         self.__temp = 0
         self.__humidity = 0
         self.__pressure = 0
+        self.__writer = ReportWriter(file_name, format)
+        # the writer thread stops when the display is collected
+        weakref.finalize(self, self.__writer.close)
 
-    def update(self, obs=None, **kwargs):
+    def update(self, obs=None, data=None, **kwargs):
         print(f'\n-- Update: {self}')
 
-        if isinstance(obs, WeatherData):
-            self.__temp = obs.get_temperature()
-            self.__humidity = obs.get_humidity()
-            self.__pressure = obs.get_pressure()
+        measurement = self.measurement(obs, data, **kwargs)
+        self.__temp = measurement.temp
+        self.__humidity = measurement.humidity
+        self.__pressure = measurement.pressure
+
+        self.display()
+        print('-- Done')
+
+    def display(self):
+        print(f'Generate: {self.__writer.file_name}')
+        # queued for the writer thread, the observer never waits for the disk
+        self.__writer.write(
+            datetime.datetime.now(),
+            Measurement(self.__temp, self.__humidity, self.__pressure)
+        )
+
+    def close(self):
+        self.__writer.close()
+
+
+class MappedColumns:
+    # fixed-width columns in memory-mapped files `<prefix>.<name>`, the row
+    # count lives in `<prefix>.length`, files grow by doubling
+    def __init__(self, prefix, columns, capacity=1024):
+        self.prefix = prefix
+        self.dtypes = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self.__length = self.__map('length', np.int64, 1)
+        self.capacity = max(capacity, int(self.__length[0]))
+        self.__columns = {
+            name: self.__map(name, dtype, self.capacity)
+            for name, dtype in self.dtypes.items()
+        }
+
+    def __map(self, name, dtype, rows):
+        path = f'{self.prefix}.{name}'
+        size = rows * np.dtype(dtype).itemsize
+        with open(path, 'ab') as file:
+            if file.tell() < size:
+                file.truncate(size)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=(rows,))
+
+    def __len__(self):
+        return int(self.__length[0])
+
+    def __grow(self, rows):
+        capacity = self.capacity
+        while capacity < rows:
+            capacity *= 2
+        if capacity != self.capacity:
+            for name, column in self.__columns.items():
+                column.flush()
+                self.__columns[name] = self.__map(name, self.dtypes[name], capacity)
+            self.capacity = capacity
+
+    def append(self, **columns):
+        length = len(self)
+        rows = len(next(iter(columns.values())))
+        self.__grow(length + rows)
+        for name, values in columns.items():
+            self.__columns[name][length:length + rows] = values
+        self.__length[0] = length + rows
+
+    def column(self, name):
+        # a writable view of the stored rows, no copy
+        return self.__columns[name][:len(self)]
+
+    def flush(self):
+        for column in self.__columns.values():
+            column.flush()
+        self.__length.flush()
+
+
+class HistoryStore:
+    # readings as time-ordered memory-mapped columns plus per-minute and
+    # per-hour count/sum/min/max kept up to date on every append
+    FIELDS = Measurement.__slots__
+    LEVELS = {'minute': 60, 'hour': 3600}
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.raw = MappedColumns(
+            os.path.join(directory, 'raw'),
+            {'time': np.float64, **{field: np.float64 for field in self.FIELDS}}
+        )
+        aggregate = {'start': np.float64, 'count': np.int64}
+        for field in self.FIELDS:
+            for kind in ('sum', 'min', 'max'):
+                aggregate[f'{field}_{kind}'] = np.float64
+        self.levels = {
+            level: MappedColumns(os.path.join(directory, level), aggregate, 64)
+            for level in self.LEVELS
+        }
+
+    def __len__(self):
+        return len(self.raw)
+
+    def append(self, times, temp, humidity, pressure):
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        columns = dict(zip(self.FIELDS, (
+            np.broadcast_to(np.asarray(values, dtype=float), times.shape)
+            for values in (temp, humidity, pressure)
+        )))
+        if not len(times):
+            return
+        last = self.raw.column('time')[-1:]
+        if np.any(np.diff(times) < 0) or (len(last) and times[0] < last[0]):
+            raise ValueError('Readings must be appended in time order')
+        self.raw.append(time=times, **columns)
+        for level, seconds in self.LEVELS.items():
+            self.__aggregate(self.levels[level], seconds, times, columns)
+
+    @staticmethod
+    def __aggregate(store, seconds, times, columns):
+        buckets = np.floor(times / seconds) * seconds
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        rows = {
+            'start': buckets[starts],
+            'count': np.diff(np.r_[starts, len(times)]),
+        }
+        for field, values in columns.items():
+            rows[f'{field}_sum'] = np.add.reduceat(values, starts)
+            rows[f'{field}_min'] = np.minimum.reduceat(values, starts)
+            rows[f'{field}_max'] = np.maximum.reduceat(values, starts)
+        # the first bucket may continue the last stored one
+        if len(store) and store.column('start')[-1] == rows['start'][0]:
+            for name, values in rows.items():
+                column = store.column(name)
+                if name.endswith('_min'):
+                    column[-1] = min(column[-1], values[0])
+                elif name.endswith('_max'):
+                    column[-1] = max(column[-1], values[0])
+                elif name != 'start':
+                    column[-1] += values[0]
+            rows = {name: values[1:] for name, values in rows.items()}
+        if len(rows['start']):
+            store.append(**rows)
+
+    @staticmethod
+    def __range(store, key, start, end):
+        times = store.column(key)
+        first, last = np.searchsorted(times, (start, end), side='left')
+        return {name: store.column(name)[first:last] for name in store.dtypes}
+
+    def range(self, start, end):
+        # readings with start <= time < end as views into the mapped files
+        return self.__range(self.raw, 'time', start, end)
+
+    def aggregate(self, level, start, end):
+        # per-minute or per-hour buckets starting in [start, end), as views
+        return self.__range(self.levels[level], 'start', start, end)
+
+    def mean(self, level, field, start, end):
+        rows = self.aggregate(level, start, end)
+        return rows[f'{field}_sum'] / rows['count']
+
+    def flush(self):
+        self.raw.flush()
+        for store in self.levels.values():
+            store.flush()
+
+
+class HistoryWeakDisplay(WeakDisplay):
+    def __init__(self, weather_data, directory='2observer-history'):
+        super().__init__(weather_data)
+        self.store = HistoryStore(directory)
+
+    def now(self):
+        # never earlier than what is stored, the store is kept in time order
+        return max(time.time(), self.store.raw.column('time')[-1:].max(initial=0))
+
+    def update(self, obs=None, data=None, **kwargs):
+        print(f'\n-- Update: {self}')
+
+        measurement = self.measurement(obs, data, **kwargs)
+        self.store.append(
+            self.now(), measurement.temp, measurement.humidity, measurement.pressure
+        )
+
+        self.display()
+        print('-- Done')
+
+    def update_batch(self, obs=None, batch=None):
+        print(f'\n-- Update: {self} ({len(batch)} readings)')
+
+        # history is only kept with real times, and only newer than stored
+        if batch.times is None:
+            print('Skipped: the batch has no times')
         else:
-            self.__temp = kwargs.get('temp', 0)
-            self.__humidity = kwargs.get('humidity', 0)
-            self.__pressure = kwargs.get('pressure', 0)
+            last = self.store.raw.column('time')[-1:].max(initial=-math.inf)
+            newer = batch.times > last
+            if not newer.all():
+                print(f'Skipped: {len(batch) - newer.sum()} readings already stored')
+            self.store.append(
+                batch.times[newer], batch.temp[newer],
+                batch.humidity[newer], batch.pressure[newer]
+            )
 
         self.display()
         print('-- Done')
 
     def display(self):
-        file_name = "2observer-weak-weather.txt"
-        print(f'Generate: {file_name}')
-        with open('2observer-weak-weather.txt', 'a') as file:
-            date = datetime.datetime.now()
-            report = f'---\n{date}\nTemperature: {self.__temp}\nHumidity: {self.__humidity}\nPressure: {self.__pressure}\n'
-            file.write(report)
+        now = time.time()
+        hours = self.store.aggregate('hour', now - 24 * 3600, now + 3600)
+        print(
+            f'Stored: {len(self.store)} readings, '
+            f'{len(hours["start"])} hours in the last day'
+        )
+        if len(hours['start']):
+            print(
+                f'Temperature this hour: mean '
+                f'{hours["temp_sum"][-1] / hours["count"][-1]:.2f}, '
+                f'min {hours["temp_min"][-1]}, max {hours["temp_max"][-1]}'
+            )
 
+    def close(self):
+        self.store.flush()
 
-class Observable(metaclass=abc.ABCMeta):
+
+class WeakIdentityDict:
+    # observer -> value by identity, never through the observer's own
+    # __eq__/__hash__, weak references only: the entry is dropped when the
+    # garbage collector takes the observer, bound methods are kept as weak
+    # methods so the callback does not keep its object alive
     def __init__(self):
+        def discard(key, ref, table=weakref.ref(self)):
+            table = table()
+            if table is not None:
+                entry = table.__entries.get(key)
+                if entry is not None and entry[0] is ref:
+                    del table.__entries[key]
+
+        self.__discard = discard
+        self.__entries = dict()
+
+    @staticmethod
+    def key(observer):
+        # ids are safe, the entry goes before the id can be reused
+        if isinstance(observer, types.MethodType):
+            return (id(observer.__self__), id(observer.__func__))
+        return (id(observer), None)
+
+    @staticmethod
+    def reference(observer, callback=None):
+        if isinstance(observer, types.MethodType):
+            return weakref.WeakMethod(observer, callback)
+        return weakref.ref(observer, callback)
+
+    def get(self, observer, default=None):
+        entry = self.__entries.get(self.key(observer))
+        return default if entry is None else entry[1]
+
+    def setdefault(self, observer, value):
+        key = self.key(observer)
+        entry = self.__entries.get(key)
+        if entry is None:
+            ref = self.reference(observer, functools.partial(self.__discard, key))
+            entry = self.__entries[key] = (ref, value)
+        return entry[1]
+
+    def __delitem__(self, observer):
+        del self.__entries[self.key(observer)]
+
+    def __contains__(self, observer):
+        return self.key(observer) in self.__entries
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def keys(self):
+        return list(self.__entries)
+
+    def entries(self):
+        # a copy, the garbage collector may prune while observers run
+        for key, (ref, value) in list(self.__entries.items()):
+            observer = ref()
+            if observer is not None:
+                yield key, observer, value
+
+    def clear(self):
+        self.__entries.clear()
+
+
+class ObserverRegistry(WeakIdentityDict):
+    def add(self, observer):
+        self.setdefault(observer, None)
+
+    def remove(self, observer):
+        del self[observer]
+
+    def items(self):
+        for key, observer, _ in self.entries():
+            yield key, observer
+
+    def __iter__(self):
+        for _, observer, _ in self.entries():
+            yield observer
+
+
+class Mailbox:
+    # bounded queue of pending updates for one observer, when it is full
+    # 'block' waits for room, 'drop_oldest' discards the oldest update and
+    # 'coalesce' keeps only the latest one
+    POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+    def __init__(self, maxsize=16, policy='block'):
+        if policy not in self.POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.scheduled = False
+        self.dropped = 0
+
+    def put(self, item):
+        # True when nobody serves the mailbox yet and a drain must be started
+        with self.condition:
+            if self.policy == 'coalesce':
+                self.dropped += len(self.items)
+                self.items.clear()
+            elif self.policy == 'drop_oldest':
+                while len(self.items) >= self.maxsize:
+                    self.items.popleft()
+                    self.dropped += 1
+            else:
+                self.condition.wait_for(lambda: len(self.items) < self.maxsize)
+            self.items.append(item)
+            if self.scheduled:
+                return False
+            self.scheduled = True
+            return True
+
+    def take(self):
+        with self.condition:
+            self.condition.notify_all()
+            if not self.items:
+                self.scheduled = False
+                return None
+            return self.items.popleft()
+
+
+class ConcurrentDispatcher:
+    # every observer has its own mailbox served by at most one pool thread at
+    # a time, so updates keep their order and a slow observer only delays itself
+    def __init__(self, max_workers=None, maxsize=16, policy='block'):
+        if policy not in Mailbox.POLICIES:
+            raise ValueError(f'Unknown overflow policy: {policy}')
+        self.maxsize = maxsize
+        self.policy = policy
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix=self.__class__.__name__
+        )
+        # mailboxes die with their observers
+        self.__mailboxes = WeakIdentityDict()
+        self.__lock = threading.Lock()
+        self.__idle = threading.Condition()
+        self.__draining = 0
+
+    def mailbox(self, observer):
+        mailbox = self.__mailboxes.get(observer)
+        if mailbox is None:
+            with self.__lock:
+                mailbox = self.__mailboxes.setdefault(
+                    observer, Mailbox(self.maxsize, self.policy)
+                )
+        return mailbox
+
+    def post(self, observer, update, *args, **kwargs):
+        mailbox = self.mailbox(observer)
+        if mailbox.put((update, args, kwargs)):
+            with self.__idle:
+                self.__draining += 1
+            self.__executor.submit(self.__drain, mailbox)
+
+    def __drain(self, mailbox):
+        try:
+            while (item := mailbox.take()) is not None:
+                update, args, kwargs = item
+                try:
+                    update(*args, **kwargs)
+                except Exception as error:
+                    print(f'-- Failed: {update}: {error!r}', file=sys.stderr)
+        finally:
+            with self.__idle:
+                self.__draining -= 1
+                self.__idle.notify_all()
+
+    def join(self):
+        # wait until every mailbox is empty
+        with self.__idle:
+            self.__idle.wait_for(lambda: not self.__draining)
+
+    def close(self):
+        self.join()
+        self.__executor.shutdown()
+
+
+class ObserverStats:
+    # calls of one observer, latencies in a log2 histogram of nanoseconds
+    __slots__ = ('name', 'count', 'total', 'maximum', 'histogram')
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+        self.histogram = [0] * 64
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.maximum:
+            self.maximum = elapsed
+        self.histogram[elapsed.bit_length()] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, q):
+        # upper bound of the bucket holding the q-th call, within 2x
+        rank = q * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) - 1, self.maximum)
+        return 0
+
+    def __str__(self):
+        return (
+            f'{self.name:>32} {self.count:>8} {self.total / 1e6:>10.3f} '
+            f'{self.mean / 1e3:>9.1f} {self.percentile(0.99) / 1e3:>9.1f} '
+            f'{self.maximum / 1e3:>9.1f}'
+        )
+
+
+class Instrumentation:
+    # times every observer call, warns when one takes longer than `slow`
+    # seconds and prints a summary every `interval` seconds
+    def __init__(self, slow=None, interval=None, file=None):
+        self.slow = None if slow is None else int(slow * 1e9)
+        self.interval = interval
+        self.file = file
+        # dropped with the observer
+        self.__stats = WeakIdentityDict()
+        self.__next_summary = (
+            None if interval is None else time.monotonic() + interval
+        )
+
+    @staticmethod
+    def name(observer):
+        if isinstance(observer, types.MethodType):
+            return f'{observer.__self__}.{observer.__func__.__name__}'
+        return str(observer)
+
+    def lookup(self, observer, create=True):
+        stats = self.__stats.get(observer)
+        if stats is None and create:
+            stats = self.__stats.setdefault(observer, ObserverStats(self.name(observer)))
+        return stats
+
+    def call(self, observer, update, *args, **kwargs):
+        started = time.perf_counter_ns()
+        try:
+            return update(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter_ns() - started
+            self.lookup(observer).add(elapsed)
+            if self.slow is not None and elapsed > self.slow:
+                self.warn(observer, elapsed)
+            if self.__next_summary is not None and time.monotonic() >= self.__next_summary:
+                self.__next_summary = time.monotonic() + self.interval
+                self.summary()
+
+    def warn(self, observer, elapsed):
+        print(
+            f'-- Slow: {self.name(observer)} took {elapsed / 1e6:.3f} ms',
+            file=self.file or sys.stderr
+        )
+
+    def stats(self, observer=None):
+        if observer is not None:
+            return self.lookup(observer, create=False)
+        return [stats for _, _, stats in self.__stats.entries()]
+
+    def reset(self):
+        self.__stats.clear()
+
+    def summary(self):
+        file = self.file or sys.stdout
+        print(
+            f'{"observer":>32} {"calls":>8} {"total ms":>10} {"mean us":>9} '
+            f'{"p99 us":>9} {"max us":>9}',
+            file=file
+        )
+        for stats in sorted(self.stats(), key=lambda stats: stats.total, reverse=True):
+            print(stats, file=file)
+
+
+class Observable(metaclass=abc.ABCMeta):
+    def __init__(self, dispatcher=None, instrumentation=None):
         self.changed = False
-        self.__observers = dict()
+        # observers of every change and observers of single fields
+        self.__observers = ObserverRegistry()
+        self.__topics = dict()
+        # None calls observers in turn, a ConcurrentDispatcher queues to them
+        self.dispatcher = dispatcher
+        self.instrumentation = instrumentation
 
     def set_changed(self):
         self.changed = True
@@ -310,64 +1285,774 @@ class Observable(metaclass=abc.ABCMeta):
     def has_changed(self):
         return self.changed
 
-    def registerObserver(self, observer):
-        self.__observers[id(observer)] = observer
+    def registerObserver(self, observer, fields=None):
+        if fields is None:
+            self.__observers.add(observer)
+            return
+        for field in fields:
+            self.__topics.setdefault(field, ObserverRegistry()).add(observer)
 
     def removeObserver(self, observer):
-        del self.__observers[id(observer)]
-
-    def notifyObservers(self, **kwargs):
+        registries = [
+            registry for registry in (self.__observers, *self.__topics.values())
+            if observer in registry
+        ]
+        if not registries:
+            raise KeyError(observer)
+        for registry in registries:
+            registry.remove(observer)
+
+    def countObservers(self):
+        keys = set(self.__observers.keys())
+        for registry in self.__topics.values():
+            keys.update(registry.keys())
+        return len(keys)
+
+    def subscribers(self, fields=None):
+        # observers of the changed fields, every observer for an unknown change
+        if fields is None:
+            registries = [self.__observers, *self.__topics.values()]
+        else:
+            registries = [self.__observers] + [
+                self.__topics[field] for field in fields if field in self.__topics
+            ]
+        registries = [registry for registry in registries if len(registry)]
+        if len(registries) == 1:
+            yield from registries[0]
+            return
+        # an observer of several changed fields is notified once
+        seen = set()
+        for registry in registries:
+            for key, observer in registry.items():
+                if key not in seen:
+                    seen.add(key)
+                    yield observer
+
+    def notifyObservers(self, data=None, fields=None, **kwargs):
         if self.has_changed:
-            for observer_id in self.__observers:
+            for observer in self.subscribers(fields):
+                # an observer object or a bound callback like display.update
+                update = (
+                    observer if isinstance(observer, types.MethodType)
+                    else observer.update
+                )
                 if kwargs:
-                    self.__observers.get(observer_id).update(**kwargs)
+                    self.dispatch(observer, update, **kwargs)
                 else:
-                    self.__observers.get(observer_id).update(self)
+                    self.dispatch(observer, update, self, data)
 
         self.clear_changed()
 
+    def notifyObserversBatch(self, batch, fields=None):
+        # one round for the whole batch, observers without update_batch get
+        # the latest reading like after a single change
+        if self.has_changed:
+            latest = None
+            for observer in self.subscribers(fields):
+                update_batch = getattr(observer, 'update_batch', None)
+                if update_batch is not None:
+                    self.dispatch(observer, update_batch, self, batch)
+                    continue
+                if latest is None:
+                    latest = batch.last()
+                update = (
+                    observer if isinstance(observer, types.MethodType)
+                    else observer.update
+                )
+                self.dispatch(observer, update, self, latest)
+
+        self.clear_changed()
+
+    def dispatch(self, observer, update, *args, **kwargs):
+        if self.instrumentation is not None:
+            # timed where it runs, on a dispatcher thread if there is one
+            args = (observer, update, *args)
+            update = self.instrumentation.call
+        if self.dispatcher is None:
+            update(*args, **kwargs)
+        else:
+            self.dispatcher.post(observer, update, *args, **kwargs)
+
 class WeatherData(Observable):
+    def __init__(self, dispatcher=None, debounce=0, instrumentation=None):
+        super().__init__(dispatcher, instrumentation)
+        self.__measurement = Measurement(0, 0, 0)
+        # seconds to wait for more changes, only the latest one is delivered
+        self.debounce = debounce
+        self.__delivered = None
+        self.__timer = None
+        self.__lock = threading.Lock()
+
+    def registerObserver(self, observer, fields=None):
+        if fields is not None:
+            unknown = set(fields) - set(Measurement.__slots__)
+            if unknown:
+                raise ValueError(f'Unknown measurement fields: {sorted(unknown)}')
+        super().registerObserver(observer, fields)
+
+    def get_measurement(self):
+        return self.__measurement
 
     def get_temperature(self):
-        return self.__temp
+        return self.__measurement.temp
 
     def get_humidity(self):
-        return self.__humidity
+        return self.__measurement.humidity
 
     def get_pressure(self):
-        return self.__pressure
+        return self.__measurement.pressure
 
     def mesurement_changed(self):
+        if self.debounce <= 0:
+            self.__deliver()
+            return
+        # the first change of a burst starts the window, later ones only
+        # replace the measurement the timer will deliver
+        with self.__lock:
+            if self.__timer is None:
+                self.__timer = threading.Timer(self.debounce, self.flush)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+    def flush(self):
+        # deliver a debounced change now
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+        self.__deliver()
+
+    def __deliver(self):
+        with self.__lock:
+            measurement = self.__measurement
+            fields = measurement.changed(self.__delivered)
+            # observers already have these values
+            if not fields:
+                return
+            self.__delivered = measurement
+
         self.set_changed()
-        self.notifyObservers()
+        # push one snapshot to the observers of the changed fields
+        self.notifyObservers(measurement, fields)
         # self.notifyObservers(temp=1,humidity=1,pressure=1)
 
     # test method
-    def set_measurements(self):
-        self.__temp = random.randrange(-10,10)
-        self.__humidity = random.randrange(0,600)
-        self.__pressure = random.randrange(-10, 1000)
+    def set_measurements(self, temp=None, humidity=None, pressure=None):
+        self.__measurement = Measurement(
+            random.randrange(-10,10) if temp is None else temp,
+            random.randrange(0,600) if humidity is None else humidity,
+            random.randrange(-10, 1000) if pressure is None else pressure
+        )
 
         self.mesurement_changed()
 
+    def set_measurements_batch(self, temp, humidity, pressure, times=None):
+        batch = MeasurementBatch(temp, humidity, pressure, times)
+        # the batch is newer than a debounced change still waiting
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            fields = batch.changed(self.__delivered)
+            if not fields:
+                return
+            self.__measurement = self.__delivered = batch.last()
+
+        self.set_changed()
+        self.notifyObserversBatch(batch, fields)
+
 
 class WeatherStation:
     def __init__(self):
-        self.weather_data = WeatherData()
-
-        currentConditionDisplay = CurrentConditionWeakDisplay(self.weather_data)
-        statisticDisplay = StatisticWeakDisplay(self.weather_data)
-        forecastDisplay = ForecastWeakDisplay(self.weather_data)
-        heatDisplay = HeatIndexWeakDisplay(self.weather_data)
-        reportDisplay = ReportWeakDisplay(self.weather_data)
+        self.weather_data = WeatherData(instrumentation=Instrumentation(slow=0.01))
+
+        # weather data keeps weak references, the station owns the displays
+        self.displays = [
+            CurrentConditionWeakDisplay(self.weather_data),
+            StatisticWeakDisplay(self.weather_data),
+            ForecastWeakDisplay(self.weather_data),
+            HeatIndexWeakDisplay(self.weather_data),
+            ReportWeakDisplay(self.weather_data),
+            HistoryWeakDisplay(self.weather_data),
+        ]
 
     def run(self):
         self.weather_data.set_measurements()
         self.weather_data.set_measurements()
         self.weather_data.set_measurements()
 
-ws = WeatherStation()
+    def replay(self, minutes=24 * 60):
+        # the last day of per-minute readings in a single notification round
+        rng = np.random.default_rng()
+        self.weather_data.set_measurements_batch(
+            rng.integers(-10, 10, minutes),
+            rng.integers(0, 600, minutes),
+            rng.integers(-10, 1000, minutes),
+            time.time() - 60 * np.arange(minutes, 0, -1)
+        )
+
+    def close(self):
+        self.weather_data.flush()
+        for display in self.displays:
+            if isinstance(display, (ReportWeakDisplay, HistoryWeakDisplay)):
+                display.close()
+        print()
+        self.weather_data.instrumentation.summary()
 
-ws.run()
+class StationSummary:
+    # what a worker process sends back for one station
+    __slots__ = ('station', 'temp', 'humidity', 'pressure')
 
+    def __init__(self, station, temp, humidity, pressure):
+        self.station = station
+        self.temp = temp
+        self.humidity = humidity
+        self.pressure = pressure
 
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.station}, {self.temp.count} readings)'
+
+
+class SummaryObserver(Observer):
+    # the quiet observer a worker hangs on each of its stations
+    def __init__(self):
+        self.fields = {field: Moments() for field in Measurement.__slots__}
+
+    def update(self, obs=None, data=None, **kwargs):
+        for field, moments in self.fields.items():
+            moments.add(getattr(data, field))
+
+    def update_batch(self, obs=None, batch=None):
+        for field, moments in self.fields.items():
+            moments.add_batch(getattr(batch, field))
+
+
+def run_station(station, readings=24 * 60, chunk=60, seed=0):
+    # a station and its observers live and die inside the worker process
+    weather_data = WeatherData()
+    summary = SummaryObserver()
+    weather_data.registerObserver(summary)
+    rng = np.random.default_rng((seed, station))
+    for first in range(0, readings, chunk):
+        size = min(chunk, readings - first)
+        weather_data.set_measurements_batch(
+            rng.normal(10, 5, size),
+            rng.uniform(0, 600, size),
+            rng.uniform(700, 800, size)
+        )
+    return StationSummary(station, **summary.fields)
+
+
+class FleetAggregator(Observable):
+    # global statistics over every station, observers get each summary
+    def __init__(self, dispatcher=None, instrumentation=None):
+        super().__init__(dispatcher, instrumentation)
+        self.stations = dict()
+        self.fields = {field: Moments() for field in Measurement.__slots__}
+
+    def add(self, summary):
+        self.stations[summary.station] = summary
+        for field, moments in self.fields.items():
+            moments.merge(getattr(summary, field))
+        self.set_changed()
+        self.notifyObservers(summary)
+
+
+class FleetRunner:
+    # stations sharded over worker processes, summaries streamed back in
+    # order as the shards finish
+    def __init__(self, stations=100, readings=24 * 60, workers=None, seed=0):
+        self.stations = stations
+        self.readings = readings
+        self.workers = workers or os.cpu_count()
+        self.seed = seed
+
+    def run(self, aggregator):
+        stations = range(self.stations)
+        arguments = (
+            stations, itertools.repeat(self.readings),
+            itertools.repeat(60), itertools.repeat(self.seed)
+        )
+        if self.workers == 1:
+            summaries = map(run_station, *arguments)
+            for summary in summaries:
+                aggregator.add(summary)
+            return aggregator
+        chunksize = max(1, self.stations // (self.workers * 4))
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as executor:
+            for summary in executor.map(run_station, *arguments, chunksize=chunksize):
+                aggregator.add(summary)
+        return aggregator
+
+
+class FleetWeakDisplay(Observer, DisplayElement):
+    def __init__(self, aggregator, every=25):
+        self.aggregator = aggregator
+        self.every = every
+        aggregator.registerObserver(self)
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def update(self, obs=None, data=None, **kwargs):
+        if len(self.aggregator.stations) % self.every == 0:
+            self.display()
+
+    def display(self):
+        fields = self.aggregator.fields
+        print(
+            f'{len(self.aggregator.stations)} stations, '
+            f'{fields["temp"].count} readings\n'
+            f'Temperature: {fields["temp"]}\nHumidity: {fields["humidity"]}\n'
+            f'Pressure: {fields["pressure"]}'
+        )
+
+
+def station_example():
+    print('\nAdvanced example - subscription')
+    print('\none to many')
+
+    ws = WeatherStation()
+
+    ws.replay()
+    ws.run()
+    ws.close()
+
+
+def fleet_example():
+    print('\nFleet - stations in worker processes')
+    aggregator = FleetAggregator()
+    fleet_display = FleetWeakDisplay(aggregator)
+    FleetRunner(stations=50).run(aggregator)
+
+
+def benchmark_notifications(counts=(1, 10, 100, 1000), rounds=1000):
+    print('\nBenchmark - cost of one notification')
+
+    class PullObserver(Observer):
+        def update(self, obs=None, data=None, **kwargs):
+            self.values = (
+                obs.get_temperature(), obs.get_humidity(), obs.get_pressure()
+            )
+
+    class KwargsObserver(Observer):
+        def update(self, obs=None, data=None, **kwargs):
+            self.values = (kwargs['temp'], kwargs['humidity'], kwargs['pressure'])
+
+    class PushObserver(Observer):
+        def update(self, obs=None, data=None, **kwargs):
+            self.values = (data.temp, data.humidity, data.pressure)
+
+    def notify(weather_data, measurement):
+        weather_data.set_changed()
+        weather_data.notifyObservers()
+
+    def notify_kwargs(weather_data, measurement):
+        weather_data.set_changed()
+        weather_data.notifyObservers(
+            temp=measurement.temp,
+            humidity=measurement.humidity,
+            pressure=measurement.pressure
+        )
+
+    def notify_snapshot(weather_data, measurement):
+        weather_data.set_changed()
+        weather_data.notifyObservers(measurement)
+
+    print(f'{"observers":>10} {"pull us":>10} {"kwargs us":>10} {"push us":>10}')
+    for count in counts:
+        row = []
+        for observer_class, send in (
+            (PullObserver, notify),
+            (KwargsObserver, notify_kwargs),
+            (PushObserver, notify_snapshot),
+        ):
+            weather_data = WeatherData()
+            observers = [observer_class() for _ in range(count)]
+            for observer in observers:
+                weather_data.registerObserver(observer)
+            measurement = weather_data.get_measurement()
+            started = time.perf_counter()
+            for _ in range(rounds):
+                send(weather_data, measurement)
+            row.append((time.perf_counter() - started) / rounds * 1e6)
+        print(f'{count:>10} {row[0]:>10.2f} {row[1]:>10.2f} {row[2]:>10.2f}')
+
+
+def benchmark_batch(readings=24 * 60 * 60):
+    print('\nBenchmark - replay a day of per-second readings')
+
+    class StatisticObserver(Observer):
+        def __init__(self):
+            self.temp = StreamingStatistics()
+
+        def update(self, obs=None, data=None, **kwargs):
+            self.temp.add(data.temp)
+
+        def update_batch(self, obs=None, batch=None):
+            self.temp.add_batch(batch.temp)
+
+    class LatestObserver(Observer):
+        def update(self, obs=None, data=None, **kwargs):
+            self.latest = data
+
+    rng = np.random.default_rng(0)
+    temp = rng.normal(15, 5, readings)
+    humidity = rng.uniform(0, 600, readings)
+    pressure = rng.uniform(700, 800, readings)
+
+    for name, ingest in (
+        ('one by one', lambda weather_data: [
+            weather_data.set_changed() or weather_data.notifyObservers(
+                Measurement(t, h, p)
+            )
+            for t, h, p in zip(temp.tolist(), humidity.tolist(), pressure.tolist())
+        ]),
+        ('batch', lambda weather_data: weather_data.set_measurements_batch(
+            temp, humidity, pressure
+        )),
+    ):
+        weather_data = WeatherData()
+        observers = [StatisticObserver(), LatestObserver()]
+        for observer in observers:
+            weather_data.registerObserver(observer)
+        started = time.perf_counter()
+        ingest(weather_data)
+        elapsed = time.perf_counter() - started
+        statistics = observers[0].temp
+        print(
+            f'{name:>10}: {elapsed * 1000:>9.1f} ms, mean {statistics.mean:.4f}, '
+            f'std {statistics.std:.4f}, median ~{statistics.median}'
+        )
+
+
+def benchmark_heat_index(readings=1_000_000):
+    print('\nBenchmark - heat index over a million readings')
+
+    def scalar_heat_index(t, rh):
+        # the original term by term polynomial
+        return (
+            (16.923 + (0.185212 * t) + (5.37941 * rh) - (0.100254 * t * rh)
+                + (0.00941695 * (t * t))
+                + (0.00728898 * (rh * rh))
+                + (0.000345372 * (t * t * rh))
+                - (0.000814971 * (t * rh * rh))
+                + (0.0000102102 * (t * t * rh * rh))
+                - (0.000038646 * (t * t * t))
+                + (0.0000291583 *(rh * rh * rh))
+                + (0.00000142721 * (t * t * t * rh))
+                + (0.000000197483 * (t * rh * rh * rh))
+                - (0.0000000218429 * (t * t * t * rh * rh))
+                + 0.000000000843296 * (t * t * rh * rh * rh)
+            )
+            - (0.0000000000481975 * (t * t * t * rh * rh * rh))
+        )
+
+    rng = np.random.default_rng(0)
+    # sensors with 0.5 degree and 1% resolution
+    t = np.round(rng.uniform(20, 45, readings) * 2) / 2
+    rh = np.round(rng.uniform(0, 100, readings))
+    ts, rhs = t.tolist(), rh.tolist()
+
+    started = time.perf_counter()
+    expected = [scalar_heat_index(a, b) for a, b in zip(ts, rhs)]
+    scalar = time.perf_counter() - started
+
+    HeatIndexWeakDisplay.cached_heat_index.cache_clear()
+    started = time.perf_counter()
+    cached = [HeatIndexWeakDisplay.cached_heat_index(a, b) for a, b in zip(ts, rhs)]
+    memoised = time.perf_counter() - started
+    info = HeatIndexWeakDisplay.cached_heat_index.cache_info()
+
+    started = time.perf_counter()
+    vectorised = HeatIndexWeakDisplay.get_heat_index(t, rh)
+    horner = time.perf_counter() - started
+
+    error = max(
+        np.abs(vectorised - expected).max(), np.abs(np.subtract(cached, expected)).max()
+    )
+    print(f'{"scalar":>10}: {scalar * 1000:>9.1f} ms')
+    print(
+        f'{"cached":>10}: {memoised * 1000:>9.1f} ms '
+        f'({info.hits} hits, {info.misses} misses)'
+    )
+    print(f'{"vectorised":>10}: {horner * 1000:>9.1f} ms, max error {error:.2e}')
+
+
+def benchmark_concurrent_dispatch(readings=100, interval=0.001, delay=0.01):
+    print('\nBenchmark - fast and slow observers behind a concurrent dispatcher')
+
+    class RateObserver(Observer):
+        def __init__(self, delay):
+            self.delay = delay
+            self.seen = 0
+            self.latest = None
+
+        def update(self, obs=None, data=None, **kwargs):
+            time.sleep(self.delay)
+            self.seen += 1
+            self.latest = data
+
+    print(
+        f'{"policy":>12} {"publish ms":>11} {"fast seen":>10} '
+        f'{"slow seen":>10} {"slow latest":>12}'
+    )
+    for policy in ('sync',) + Mailbox.POLICIES:
+        dispatcher = None if policy == 'sync' else ConcurrentDispatcher(
+            max_workers=4, maxsize=8, policy=policy
+        )
+        weather_data = WeatherData(dispatcher)
+        fast, slow = RateObserver(0), RateObserver(delay)
+        weather_data.registerObserver(slow)
+        weather_data.registerObserver(fast)
+        started = time.perf_counter()
+        for reading in range(readings):
+            weather_data.set_changed()
+            weather_data.notifyObservers(Measurement(reading, 0, 0))
+            time.sleep(interval)
+        published = time.perf_counter() - started
+        if dispatcher is not None:
+            dispatcher.close()
+        print(
+            f'{policy:>12} {published * 1000:>11.1f} {fast.seen:>10} '
+            f'{slow.seen:>10} {slow.latest.temp:>12}'
+        )
+
+
+def benchmark_debounce(readings=2000, interval=0.0005, windows=(0, 0.005, 0.05)):
+    print('\nBenchmark - a noisy high-frequency sensor')
+
+    class CountingObserver(Observer):
+        def __init__(self):
+            self.updates = 0
+            self.latest = None
+
+        def update(self, obs=None, data=None, **kwargs):
+            self.updates += 1
+            self.latest = data
+
+    # a coarse sensor, most readings repeat the previous one
+    rng = np.random.default_rng(0)
+    temps = np.cumsum(rng.random(readings) < 0.1).tolist()
+
+    print(f'{"window s":>10} {"readings":>10} {"updates":>10} {"latest":>8}')
+    for window in windows:
+        weather_data = WeatherData(debounce=window)
+        observer = CountingObserver()
+        weather_data.registerObserver(observer)
+        for temp in temps:
+            weather_data.set_measurements(temp, 50, 750)
+            time.sleep(interval)
+        weather_data.flush()
+        print(
+            f'{window:>10} {readings:>10} {observer.updates:>10} '
+            f'{observer.latest.temp:>8}'
+        )
+
+
+def benchmark_topics(observers=1000, rounds=1000):
+    print('\nBenchmark - temperature changes with field subscriptions')
+
+    class CountingObserver(Observer):
+        def __init__(self):
+            self.updates = 0
+
+        def update(self, obs=None, data=None, **kwargs):
+            self.updates += 1
+
+    fields = Measurement.__slots__
+    print(f'{"subscription":>14} {"us per change":>14} {"updates":>10}')
+    for subscription in ('all', 'field'):
+        weather_data = WeatherData()
+        displays = [CountingObserver() for _ in range(observers)]
+        for index, display in enumerate(displays):
+            weather_data.registerObserver(
+                display,
+                None if subscription == 'all' else (fields[index % len(fields)],)
+            )
+        started = time.perf_counter()
+        for temp in range(rounds):
+            weather_data.set_measurements(temp, 50, 750)
+        elapsed = time.perf_counter() - started
+        updates = sum(display.updates for display in displays)
+        print(f'{subscription:>14} {elapsed / rounds * 1e6:>14.2f} {updates:>10}')
+
+
+def benchmark_instrumentation(observers=100, rounds=2000):
+    print('\nBenchmark - cost of per-observer instrumentation')
+
+    class PushObserver(Observer):
+        def update(self, obs=None, data=None, **kwargs):
+            self.values = (data.temp, data.humidity, data.pressure)
+
+    print(f'{"instrumented":>13} {"us per change":>14}')
+    for instrumentation in (None, Instrumentation()):
+        weather_data = WeatherData(instrumentation=instrumentation)
+        displays = [PushObserver() for _ in range(observers)]
+        for display in displays:
+            weather_data.registerObserver(display)
+        started = time.perf_counter()
+        for temp in range(rounds):
+            weather_data.set_measurements(temp, 50, 750)
+        elapsed = time.perf_counter() - started
+        print(f'{instrumentation is not None!s:>13} {elapsed / rounds * 1e6:>14.2f}')
+
+
+def benchmark_history(days=365, chunk=24 * 60):
+    print('\nBenchmark - a year of per-minute readings in the history store')
+
+    rng = np.random.default_rng(0)
+    readings = days * 24 * 60
+    times = 1.7e9 + 60 * np.arange(readings, dtype=float)
+    temp = 10 + 10 * np.sin(np.arange(readings) / (24 * 60) * 2 * np.pi)
+    temp += rng.normal(0, 1, readings)
+    humidity = rng.uniform(0, 600, readings)
+    pressure = rng.uniform(700, 800, readings)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = HistoryStore(directory)
+        started = time.perf_counter()
+        for first in range(0, readings, chunk):
+            last = first + chunk
+            store.append(
+                times[first:last], temp[first:last],
+                humidity[first:last], pressure[first:last]
+            )
+        store.flush()
+        appended = time.perf_counter() - started
+
+        started = time.perf_counter()
+        week = store.range(times[0], times[0] + 7 * 24 * 3600)
+        ranged = time.perf_counter() - started
+
+        started = time.perf_counter()
+        hours = store.aggregate('hour', times[0] - 3600, times[-1] + 1)
+        hourly = hours['temp_sum'] / hours['count']
+        yearly = time.perf_counter() - started
+
+        started = time.perf_counter()
+        text = '\n'.join(
+            f'---\n{t}\nTemperature: {a}\nHumidity: {b}\nPressure: {c}'
+            for t, a, b, c in zip(
+                times.tolist(), temp.tolist(), humidity.tolist(), pressure.tolist()
+            )
+        )
+        parsed = np.array([
+            float(line.split(': ')[1]) for line in text.splitlines()
+            if line.startswith('Temperature')
+        ])
+        reparse = time.perf_counter() - started
+
+        shared = np.shares_memory(week['temp'], store.raw.column('temp'))
+        print(f'appended {readings} readings in {appended * 1000:.1f} ms')
+        print(
+            f'week range: {len(week["time"])} rows in {ranged * 1e6:.1f} us '
+            f'(view: {shared})'
+        )
+        print(
+            f'yearly hourly means: {len(hourly)} rows in {yearly * 1e6:.1f} us, '
+            f'matches raw: '
+            f'{np.isclose(np.average(hourly, weights=hours["count"]), temp.mean())}'
+        )
+        print(f're-parsing the same year as report text: {reparse * 1000:.1f} ms')
+        del week, hours, parsed
+
+
+def benchmark_fleet(stations=200, readings=7 * 24 * 60):
+    print('\nBenchmark - a fleet of stations over worker processes')
+    print(f'{"workers":>8} {"seconds":>8} {"stations/s":>11} {"mean temp":>10}')
+    for workers in sorted({1, 2, os.cpu_count()}):
+        aggregator = FleetAggregator()
+        started = time.perf_counter()
+        FleetRunner(stations, readings, workers).run(aggregator)
+        elapsed = time.perf_counter() - started
+        print(
+            f'{workers:>8} {elapsed:>8.2f} {stations / elapsed:>11.1f} '
+            f'{aggregator.fields["temp"].mean:>10.5f}'
+        )
+
+
+def benchmark_trends(stations=1000, readings=2000, window=32):
+    print('\nBenchmark - trends of many stations in one array')
+
+    rng = np.random.default_rng(0)
+    drift = rng.normal(0, 0.1, (stations, 1, 3))
+    values = np.cumsum(rng.normal(0, 1, (stations, readings, 3)) + drift, axis=1)
+
+    engine = TrendEngine(stations, window)
+    started = time.perf_counter()
+    for index in range(readings):
+        engine.append(values[:, index])
+    slopes = engine.slopes()
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    x = np.arange(window)
+    fitted = np.array([
+        np.polyfit(x, values[station, -window:], 1)[0] for station in range(stations)
+    ])
+    polyfit = time.perf_counter() - started
+
+    print(
+        f'running sums: {elapsed / readings * 1e6:.1f} us per reading of '
+        f'{stations} stations'
+    )
+    print(f'np.polyfit once per station: {polyfit * 1000:.1f} ms')
+    print(f'max slope difference: {np.abs(slopes - fitted).max():.2e}')
+
+
+def stress_weak_registry(cycles=20000, displays=50, every=4000):
+    print('\nStress - displays created and dropped on a running station')
+
+    class TemporaryDisplay(Observer):
+        def __init__(self, weather_data):
+            self.history = [0.0] * 100
+            weather_data.registerObserver(self)
+
+        def update(self, obs=None, data=None, **kwargs):
+            self.history.append(data.temp)
+
+    class CallbackDisplay:
+        def __init__(self, weather_data):
+            self.history = [0.0] * 100
+            weather_data.registerObserver(self.on_measurement)
+
+        def on_measurement(self, obs=None, data=None, **kwargs):
+            self.history.append(data.temp)
+
+    weather_data = WeatherData()
+    tracemalloc.start()
+    print(f'{"cycle":>8} {"observers":>10} {"memory KiB":>12}')
+    for cycle in range(1, cycles + 1):
+        alive = [TemporaryDisplay(weather_data) for _ in range(displays)]
+        alive += [CallbackDisplay(weather_data) for _ in range(displays)]
+        weather_data.set_changed()
+        weather_data.notifyObservers(weather_data.get_measurement())
+        del alive
+        if cycle % every == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            print(
+                f'{cycle:>8} {weather_data.countObservers():>10} '
+                f'{current / 1024:>12.1f}'
+            )
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    if 'bench' in sys.argv[1:]:
+        benchmark_notifications()
+        benchmark_batch()
+        benchmark_heat_index()
+        benchmark_concurrent_dispatch()
+        benchmark_debounce()
+        benchmark_topics()
+        benchmark_instrumentation()
+        benchmark_history()
+        benchmark_fleet()
+        benchmark_trends()
+        stress_weak_registry()
+    else:
+        introduction()
+        simple_example()
+        station_example()
+        fleet_example()